@@ -1,13 +1,80 @@
-from django.contrib import admin
+import logging
+import os
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from api.restaurant.tasks import pending_tasks, run_in_pool
+
 from .models import User, UserProfile
+from .user_import import import_users, iter_csv_rows
+
+logger = logging.getLogger(__name__)
+
+
+class UserImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row: username, email, password, role, first_name, last_name, phone, address, city, state, pincode")
+
+
+def _import_uploaded_users(path, requested_by):
+    try:
+        with open(path, 'rb') as fileobj:
+            report = import_users(iter_csv_rows(fileobj), workers=settings.USER_IMPORT_ADMIN_PROCESSES)
+        logger.info(
+            "User import by %s: %s rows in %.1fs, %s created, %s already existed, %s invalid; first errors: %s",
+            requested_by, report['rows'], report['seconds'], report['created'], report['skipped'], report['failed'],
+            report['errors'][:10],
+        )
+    finally:
+        os.unlink(path)
+
 
 class CustomUserAdmin(BaseUserAdmin):
     add_form = UserCreationForm
     form = UserChangeForm
     model = User
     list_display = ['id','username', 'email', 'role', 'status', 'is_active']
+    change_list_template = 'admin/accounts/user/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='accounts_user_import'),
+            *super().get_urls(),
+        ]
+
+    def import_view(self, request):
+        """
+        Upload a user CSV; it is imported on the imports pool (see
+        user_import.py) and the outcome is logged. Uploads are refused while
+        USER_IMPORT_MAX_QUEUED imports are waiting or running.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = UserImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid() and pending_tasks('imports') >= settings.USER_IMPORT_MAX_QUEUED:
+            form.add_error('file', "Other imports are still running; try again once they have finished, or use `manage.py import_users`.")
+        if request.method == 'POST' and form.is_valid():
+            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as target:
+                for chunk in form.cleaned_data['file'].chunks():
+                    target.write(chunk)
+            run_in_pool('imports', _import_uploaded_users, target.name, request.user.username)
+            self.message_user(request, "The import has started in the background; the result is written to the server log.", messages.SUCCESS)
+            return redirect('admin:accounts_user_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import users',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/accounts/user/import_users.html', context)
 
 admin.site.register(User, CustomUserAdmin)
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api.accounts'
+
+    def ready(self):
+        from . import me, profile_images  # noqa: F401  registers the signal receivers
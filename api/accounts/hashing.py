@@ -0,0 +1,19 @@
+"""
+Password hashing on worker processes.
+
+Workers are spawned, not forked, and import this module before Django is set
+up, so it must not import models (directly or through other modules).
+"""
+import django
+from django.contrib.auth.hashers import make_password
+
+
+def init_worker():
+    django.setup()
+
+
+def hash_password(password):
+    """
+    Hash of password, or an unusable password when it is empty.
+    """
+    return make_password(password or None)
@@ -0,0 +1,36 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.accounts.user_import import import_users, iter_csv_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create users and profiles from a CSV file (header: username, email, "
+        "password, role, first_name, last_name, phone, address, city, state, pincode). "
+        "Passwords are hashed on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=settings.USER_IMPORT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Password hashing processes (default: all cores).")
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as fileobj:
+            try:
+                report = import_users(iter_csv_rows(fileobj), batch_size=options['batch_size'], workers=options['workers'])
+            except (ValueError, UnicodeDecodeError) as exc:
+                raise CommandError(str(exc))
+
+        if report['errors']:
+            self.stderr.write(json.dumps(report['errors'], indent=2))
+        seconds = report['seconds']
+        rate = report['created'] / seconds if seconds else report['created']
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows in {seconds:.2f}s on {report['workers']} hashing processes ({rate:.0f} users/s): "
+            f"{report['created']} created, {report['skipped']} already existed, {report['failed']} invalid."
+        ))
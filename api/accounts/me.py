@@ -0,0 +1,132 @@
+"""
+The /me payload: everything an app needs on launch about the signed-in user.
+
+It is built in two queries: the user joined with the profile and annotated with
+cart and active order counts, then the stores the user owns. When orders are
+sharded, the order count adds one count query per shard. The payload is cached
+per user for ME_CACHE_SECONDS. It is invalidated when the user, the profile,
+their stores, their cart or their orders change.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.restaurant.models import CartItem, Order, Store
+from api.restaurant.sharding import order_shards
+from api.restaurant.signals import order_status_changed
+from core.routers import PRIMARY_DB
+
+from .models import UserProfile
+from .serializers import UserProfileSerializer, UserSummarySerializer
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_ORDER_STATUSES = ('Pending', 'Processing')
+
+
+def me_cache_key(user_id):
+    return f'me:{user_id}'
+
+
+def _count(queryset):
+    # COUNT(*) of queryset per user, as a correlated subquery.
+    counts = queryset.filter(user=OuterRef('pk')).order_by().values('user').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def build_me(user_id):
+    """
+    The /me payload of a user, read from the database.
+    """
+    orders_on_default = order_shards() == [PRIMARY_DB]
+    counts = {'cart_item_count': _count(CartItem.objects.all())}
+    if orders_on_default:
+        counts['active_order_count'] = _count(Order.objects.filter(order_status__in=ACTIVE_ORDER_STATUSES))
+    user = get_user_model().objects.select_related('profile').annotate(**counts).get(pk=user_id)
+
+    if orders_on_default:
+        active_orders = user.active_order_count
+    else:
+        active_orders = sum(
+            Order.objects.using(alias).filter(user_id=user_id, order_status__in=ACTIVE_ORDER_STATUSES).count()
+            for alias in order_shards()
+        )
+
+    profile = getattr(user, 'profile', None)
+    return {
+        'user': UserSummarySerializer(user).data,
+        'profile': UserProfileSerializer(profile).data if profile is not None else None,
+        'stores': [
+            {'id': store['id'], 'name': store['name'], 'type': store['type'], 'restaurant_id': store['restaurant']}
+            for store in Store.objects.filter(owner_id=user_id).order_by('name').values('id', 'name', 'type', 'restaurant')
+        ],
+        'cart_item_count': user.cart_item_count,
+        'active_order_count': active_orders,
+    }
+
+
+def get_me(user_id):
+    """
+    The /me payload of a user, from the cache when possible.
+    """
+    key = me_cache_key(user_id)
+    try:
+        payload = cache.get(key)
+    except Exception:
+        logger.warning("Cache unavailable, building /me for user %s from the database", user_id)
+        return build_me(user_id)
+    if payload is None:
+        payload = build_me(user_id)
+        try:
+            cache.set(key, payload, settings.ME_CACHE_SECONDS)
+        except Exception:
+            logger.warning("Cache unavailable, /me for user %s not cached", user_id)
+    return payload
+
+
+def invalidate_me(user_id, using=None):
+    """
+    Drop the cached payload once the current transaction commits.
+    """
+    def delete():
+        try:
+            cache.delete(me_cache_key(user_id))
+        except Exception:
+            logger.warning("Cache unavailable, /me for user %s not invalidated", user_id)
+
+    transaction.on_commit(delete, using=using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_me_on_user_change(sender, instance, **kwargs):
+    invalidate_me(instance.pk, using=instance._state.db)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_me_on_related_change(sender, instance, **kwargs):
+    invalidate_me(instance.user_id, using=instance._state.db)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_me_on_store_change(sender, instance, **kwargs):
+    invalidate_me(instance.owner_id, using=instance._state.db)
+
+
+@receiver(order_status_changed)
+def invalidate_me_on_order_status(sender, order, **kwargs):
+    # Status changes are conditional UPDATEs, which send no post_save.
+    invalidate_me(order.user_id)
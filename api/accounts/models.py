@@ -69,6 +69,10 @@ class UserProfile(models.Model):
         upload_to='profile_pics/', blank=True, null=True,
         help_text=_("Upload a profile picture.")
     )
+    image_variants = models.JSONField(
+        default=dict, blank=True,
+        help_text=_("Resized copies of profile_pic: {'source': name, 'variants': {size: {format: url}}}")
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
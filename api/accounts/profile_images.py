@@ -0,0 +1,44 @@
+"""
+Image variants for profile pictures.
+
+A new or changed profile_pic is resized on the 'images' background pool (see
+core/images.py). The variant URLs are stored in image_variants together with
+the name of the picture they were made from.
+"""
+import logging
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from api.restaurant.tasks import run_in_pool
+from core.images import ImageError, build_variants
+
+from .me import invalidate_me
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_PREFIX = 'profile_pics/variants'
+
+
+def build_profile_pic_variants(profile_id, user_id, source):
+    variants = {}
+    if source:
+        try:
+            with default_storage.open(source, 'rb') as fileobj:
+                variants = build_variants(fileobj.read(), VARIANTS_PREFIX)
+        except (ImageError, OSError) as exc:
+            logger.warning("No image variants for profile %s: %s", profile_id, exc)
+    # Only if the picture was not changed again in the meantime.
+    unchanged = Q(profile_pic=source) if source else Q(profile_pic__isnull=True) | Q(profile_pic='')
+    if UserProfile.objects.filter(unchanged, pk=profile_id).update(image_variants={'source': source, 'variants': variants}):
+        invalidate_me(user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def queue_profile_pic_variants(sender, instance, **kwargs):
+    source = instance.profile_pic.name or None
+    if (instance.image_variants or {}).get('source') != source:
+        run_in_pool('images', build_profile_pic_variants, instance.pk, instance.user_id, source)
@@ -105,19 +105,29 @@ class ResetPasswordSerializer(serializers.Serializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ('id', 'user')
-        read_only_fields = ('id', 'user')
+        fields = ('id', 'user', 'first_name', 'last_name', 'phone', 'address', 'city', 'state', 'pincode',
+                  'profile_pic', 'image_variants', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'user', 'image_variants', 'created_at', 'updated_at')
         extra_kwargs = {
-            'bio': {'required': False},
-            'profile_picture': {'required': False}
+            'profile_pic': {'required': False}
         }
         
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ('bio', 'profile_picture')
+        fields = ('first_name', 'last_name', 'phone', 'address', 'city', 'state', 'pincode', 'profile_pic')
         extra_kwargs = {
-            'bio': {'required': False},
-            'profile_picture': {'required': False}
+            'first_name': {'required': False},
+            'last_name': {'required': False},
+            'profile_pic': {'required': False}
         }
 
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    """
+    The account fields returned by /me.
+    """
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'status', 'date_joined')
+        read_only_fields = fields
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from .admin import _import_uploaded_users
+from .models import User
+
+
+@override_settings(USER_IMPORT_MAX_QUEUED=2)
+class AdminUserImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='x', email='admin@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def upload(self):
+        return self.client.post('/admin/accounts/user/import/', {
+            'file': SimpleUploadedFile('users.csv', b'username,password\nasha,secret123\n', content_type='text/csv'),
+        })
+
+    @mock.patch('api.accounts.admin.run_in_pool')
+    def test_upload_runs_on_the_imports_pool(self, run_in_pool):
+        response = self.upload()
+        self.assertRedirects(response, '/admin/accounts/user/', fetch_redirect_response=False)
+        pool, func, path, requested_by = run_in_pool.call_args.args
+        self.assertEqual((pool, func, requested_by), ('imports', _import_uploaded_users, 'admin'))
+
+        with mock.patch('api.accounts.admin.import_users', return_value=mock.MagicMock()) as import_users:
+            func(path, requested_by)
+        self.assertEqual(import_users.call_args.kwargs, {'workers': 2})
+
+    @mock.patch('api.accounts.admin.pending_tasks', return_value=2)
+    @mock.patch('api.accounts.admin.run_in_pool')
+    def test_upload_is_refused_while_the_pool_is_full(self, run_in_pool, pending_tasks):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Other imports are still running')
+        run_in_pool.assert_not_called()
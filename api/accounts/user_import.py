@@ -0,0 +1,155 @@
+"""
+Bulk user import.
+
+A user file is a CSV with a header row and one account per row: username
+(required), email, password, role and the profile columns. Rows are read as a
+stream and handled in batches:
+
+* the batch is validated in this process; invalid rows, usernames that
+  already exist and usernames repeated in the file are reported and skipped,
+* the passwords are hashed on a process pool using every core, because each
+  hash (PBKDF2 by default) costs far more than everything else together. The
+  next batch is read and validated while the pool hashes the current one,
+* users and then profiles are written with bulk_create, one transaction per
+  batch, so an interrupted import keeps the batches already written.
+
+Rows without a password get an unusable one; those users set a password with
+the forgot-password flow.
+"""
+import csv
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import serializers
+
+from core.routers import PRIMARY_DB
+
+from .hashing import hash_password, init_worker
+from .models import UserProfile
+
+User = get_user_model()
+
+PROFILE_FIELDS = ['first_name', 'last_name', 'phone', 'address', 'city', 'state', 'pincode']
+MAX_REPORTED_ERRORS = 100
+
+
+class UserImportRowSerializer(serializers.Serializer):
+    """
+    Validates one row of a user file.
+    """
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    password = serializers.CharField(required=False, allow_blank=True, default='', trim_whitespace=False)
+    role = serializers.ChoiceField(choices=User.Role.choices, default=User.Role.CUSTOMER)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    phone = serializers.CharField(max_length=20, required=False, allow_null=True, default=None)
+    address = serializers.CharField(required=False, allow_null=True, default=None)
+    city = serializers.CharField(max_length=100, required=False, allow_null=True, default=None)
+    state = serializers.CharField(max_length=100, required=False, allow_null=True, default=None)
+    pincode = serializers.CharField(max_length=20, required=False, allow_null=True, default=None)
+
+
+def iter_csv_rows(fileobj):
+    """
+    Yield one dict per row of a binary CSV file object; empty cells are left out.
+    """
+    for row in csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')):
+        yield {key: value for key, value in row.items() if key and value not in ('', None)}
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class _Report(dict):
+    def error(self, row, errors):
+        self['failed'] += 1
+        if len(self['errors']) < MAX_REPORTED_ERRORS:
+            self['errors'].append({'row': row, 'errors': errors})
+
+
+def _validate(batch, offset, seen, report):
+    serializer = UserImportRowSerializer(data=batch, many=True)
+    if serializer.is_valid():
+        results = [(row, None) for row in serializer.validated_data]
+    else:
+        # A list serializer keeps no data when any row fails: redo row by row.
+        results = []
+        for data in batch:
+            single = UserImportRowSerializer(data=data)
+            results.append((single.validated_data, None) if single.is_valid() else (None, single.errors))
+
+    rows = []
+    for index, (row, errors) in enumerate(results):
+        if errors:
+            report.error(offset + index + 1, errors)
+        elif row['username'] in seen:
+            report.error(offset + index + 1, {'username': ["Repeated in the file."]})
+        else:
+            seen.add(row['username'])
+            rows.append(row)
+
+    existing = set(
+        User.objects.using(PRIMARY_DB).filter(username__in=[row['username'] for row in rows]).values_list('username', flat=True)
+    )
+    report['skipped'] += len(existing)
+    return [row for row in rows if row['username'] not in existing]
+
+
+def _write(rows, hashes, report):
+    users = [
+        User(username=row['username'], email=row['email'], password=password, role=row['role'],
+             first_name=row['first_name'], last_name=row['last_name'])
+        for row, password in zip(rows, hashes)
+    ]
+    with transaction.atomic(using=PRIMARY_DB):
+        User.objects.using(PRIMARY_DB).bulk_create(users)
+        if any(user.pk is None for user in users):
+            # Backends that cannot return ids from a bulk insert.
+            ids = dict(User.objects.using(PRIMARY_DB).filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        UserProfile.objects.using(PRIMARY_DB).bulk_create([
+            UserProfile(user=user, **{field: row[field] for field in PROFILE_FIELDS})
+            for user, row in zip(users, rows)
+        ])
+    report['created'] += len(users)
+
+
+def import_users(rows, batch_size=None, workers=None):
+    """
+    Create users and their profiles from an iterable of row dicts.
+    Returns a report with counts, the first row errors and timings.
+    """
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    workers = workers or os.cpu_count() or 1
+    report = _Report(rows=0, created=0, skipped=0, failed=0, errors=[], workers=workers)
+    started = time.monotonic()
+    seen = set()
+    pending = None
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=init_worker) as pool:
+        for batch in _batches(rows, batch_size):
+            offset = report['rows']
+            report['rows'] += len(batch)
+            valid = _validate(batch, offset, seen, report)
+            # Submitted now, collected after the previous batch is written.
+            hashes = pool.map(hash_password, [row['password'] for row in valid], chunksize=max(1, len(valid) // (workers * 4)))
+            if pending:
+                _write(*pending, report)
+            pending = (valid, hashes)
+        if pending:
+            _write(*pending, report)
+
+    report['seconds'] = time.monotonic() - started
+    return dict(report)
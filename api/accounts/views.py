@@ -14,10 +14,11 @@ from django.utils.http import urlsafe_base64_encode
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ForgotPasswordSerializer, ResetPasswordSerializer, UserProfileSerializer, UserProfileUpdateSerializer
+from .serializers import ForgotPasswordSerializer, ResetPasswordSerializer, UserProfileUpdateSerializer
 
 
 from .models import UserProfile
+from .me import get_me
 from rest_framework.permissions import IsAuthenticated
 
 
@@ -163,29 +164,31 @@ class LogoutView(APIView):
 
 
 class UserProfileView(APIView):
+    """
+    GET returns the signed-in user's account, profile, owned stores, cart item
+    count and active order count in one payload (see me.py). PUT updates the
+    profile, DELETE removes it.
+    """
     permission_classes = [IsAuthenticated]  # Protect the view with JWT authentication
 
     def get(self, request):
+        return Response(get_me(request.user.pk))
+
+    def put(self, request):
         try:
             user_profile = UserProfile.objects.get(user=request.user)
-            serializer = UserProfileSerializer(user_profile)
-            return Response(serializer.data)
         except UserProfile.DoesNotExist:
-            return Response({
-                "id": request.user.id,
-                "user": request.user.username,
-                "message": "UserProfile not found. Returning basic user info."
-            })
-
-    def put(self, request):
-        user_profile = UserProfile.objects.get(user=request.user)
-        serializer = UserProfileUpdateSerializer(user_profile, data=request.data)
+            return Response({"error": "UserProfile not found"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = UserProfileUpdateSerializer(user_profile, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request):
-        user_profile = UserProfile.objects.get(user=request.user)
+        try:
+            user_profile = UserProfile.objects.get(user=request.user)
+        except UserProfile.DoesNotExist:
+            return Response({"error": "UserProfile not found"}, status=status.HTTP_404_NOT_FOUND)
         user_profile.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
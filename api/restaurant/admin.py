@@ -1,57 +1,89 @@
 from django.contrib import admin
+from core.paginators import EstimatedCountPaginator
 from .models import Restaurant, Menu, MenuItem, Order, OrderItem, CartItem
 # Register your models here.
 
+# Changelists below are built for large tables: related objects shown in
+# list_display are joined with list_select_related, foreign keys use
+# raw-id/autocomplete widgets instead of <select>s with every row, and
+# counts come from the table estimate instead of COUNT(*).
+
+
 class RestaurantAdmin(admin.ModelAdmin):
     list_display = ('name', 'store', 'is_active', 'created_at')
-    # search_fields = ('name', 'owner__username')
+    list_select_related = ('store',)
+    search_fields = ('name',)
     list_filter = ('is_active', 'created_at')
+    raw_id_fields = ('store',)
     ordering = ('-created_at',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(Restaurant, RestaurantAdmin)
 
 
 class MenuAdmin(admin.ModelAdmin):
     list_display = ('restaurant', 'category_name')
-    # search_fields = ('restaurant__name', 'category_name')
-    list_filter = ('restaurant',)
-    ordering = ('-restaurant',)
+    list_select_related = ('restaurant__store',)  # Restaurant.__str__ reads store.name
+    search_fields = ('category_name',)
+    autocomplete_fields = ('restaurant',)
+    ordering = ('-restaurant_id',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(Menu, MenuAdmin)
 
 class MenuItemAdmin(admin.ModelAdmin):
-    list_display = ('menu', 'name', 'price')
-    # search_fields = ('menu__category_name', 'name')
-    list_filter = ('menu',)
-    ordering = ('-menu',)
+    list_display = ('menu', 'name', 'price', 'is_available', 'stock')
+    list_select_related = ('menu',)
+    search_fields = ('name',)
+    list_filter = ('is_available',)
+    autocomplete_fields = ('menu',)
+    ordering = ('-menu_id',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(MenuItem, MenuItemAdmin)
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('restaurant', 'user', 'order_status', 'created_at')
-    # search_fields = ( 'username')
-    list_filter = ('order_status', 'created_at')
+    # Orders live on shards while restaurants and users stay on the default
+    # database, so they cannot be joined: show the ids instead.
+    list_display = ('id', 'restaurant_id', 'user_id', 'order_status', 'total_amount', 'created_at')
+    search_fields = ('=id',)
+    list_filter = ('order_status',)
+    raw_id_fields = ('restaurant', 'user')
+    date_hierarchy = 'created_at'
     ordering = ('-created_at',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 admin.site.register(Order, OrderAdmin)
 
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('order', 'item', 'quantity')
-    search_fields = ('item',)
-    list_filter = ('order',)
-    ordering = ('-order',)
+    # Menu items are on the default database, not on the order's shard.
+    list_display = ('id', 'order_id', 'item_id', 'quantity', 'price')
+    search_fields = ('=order__id',)
+    raw_id_fields = ('order', 'item')
+    ordering = ('-id',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(OrderItem, OrderItemAdmin)
 
 class CartItemAdmin(admin.ModelAdmin):
-    list_display = ('user', 'item', 'quantity')
-    search_fields = ('user',)
-    list_filter = ('user',)
-    ordering = ('-user',)
+    list_display = ('user', 'item', 'quantity', 'added_at')
+    list_select_related = ('user', 'item')
+    search_fields = ('^user__username',)
+    autocomplete_fields = ('user', 'item')
+    raw_id_fields = ('store',)
+    date_hierarchy = 'added_at'
+    ordering = ('-added_at',)
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
-admin.site.register(CartItem, CartItemAdmin)
\ No newline at end of file
+admin.site.register(CartItem, CartItemAdmin)
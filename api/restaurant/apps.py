@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RestaurantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api.restaurant'
+
+    def ready(self):
+        from . import inventory, kitchen, menu_images, signals  # noqa: F401  registers the signal receivers
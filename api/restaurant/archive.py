@@ -0,0 +1,78 @@
+"""
+Hot/cold archival of finished orders.
+
+Delivered and Cancelled orders that have not changed for
+settings.ORDER_ARCHIVE_AFTER_DAYS are moved, with their items, from the
+Order/OrderItem tables into ArchivedOrder/ArchivedOrderItem on the same
+shard. Each batch is copied and deleted in one short transaction, so the hot
+tables (and their indexes) only ever hold orders that are still in play.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .sharding import order_shards
+
+ARCHIVABLE_STATUSES = ('Delivered', 'Cancelled')
+
+
+def _copy(source, target_model):
+    """
+    Build a target_model instance from the columns it shares with source.
+    """
+    source_fields = {field.attname for field in type(source)._meta.concrete_fields}
+    return target_model(**{
+        field.attname: getattr(source, field.attname)
+        for field in target_model._meta.concrete_fields
+        if field.attname in source_fields
+    })
+
+
+def archive_batch(alias, cutoff, batch_size):
+    """
+    Move one batch of finished orders on a shard. Returns the number moved.
+    """
+    with transaction.atomic(using=alias):
+        order_ids = list(
+            Order.objects.using(alias)
+            .filter(order_status__in=ARCHIVABLE_STATUSES, updated_at__lt=cutoff)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return 0
+
+        orders = Order.objects.using(alias).filter(pk__in=order_ids)
+        items = OrderItem.objects.using(alias).filter(order_id__in=order_ids)
+        ArchivedOrder.objects.using(alias).bulk_create([_copy(order, ArchivedOrder) for order in orders])
+        ArchivedOrderItem.objects.using(alias).bulk_create([_copy(item, ArchivedOrderItem) for item in items])
+
+        items._raw_delete(alias)
+        Order.objects.using(alias).filter(pk__in=order_ids)._raw_delete(alias)
+    return len(order_ids)
+
+
+def archive_orders(age_days=None, batch_size=None, pause=0):
+    """
+    Archive every eligible order on every shard, batch by batch.
+    `pause` seconds are slept between batches to leave room for live traffic.
+    Returns the number of orders archived.
+    """
+    age_days = settings.ORDER_ARCHIVE_AFTER_DAYS if age_days is None else age_days
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=age_days)
+
+    archived = 0
+    for alias in order_shards():
+        while True:
+            moved = archive_batch(alias, cutoff, batch_size)
+            archived += moved
+            if moved < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return archived
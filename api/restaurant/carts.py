@@ -0,0 +1,46 @@
+"""
+Expiry of abandoned cart rows.
+
+``expire_stale_carts()`` is the scheduler hook: call it from cron, a task
+queue beat, or `manage.py expire_carts --interval N`. Rows older than the TTL
+are deleted by primary-key range, a small batch per transaction, so the job
+never holds long locks on the cart table.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core.routers import PRIMARY_DB
+
+from .models import CartItem
+
+
+def expire_stale_carts(ttl_hours=None, batch_size=None, pause=0):
+    """
+    Delete cart items added more than ttl_hours ago.
+    Returns (rows purged, seconds taken).
+    """
+    ttl_hours = settings.CART_TTL_HOURS if ttl_hours is None else ttl_hours
+    batch_size = batch_size or settings.CART_EXPIRY_BATCH_SIZE
+    started = time.monotonic()
+    cutoff = timezone.now() - timedelta(hours=ttl_hours)
+
+    stale = CartItem.objects.using(PRIMARY_DB).filter(added_at__lt=cutoff)
+    bounds = stale.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0, time.monotonic() - started
+
+    purged = 0
+    low = bounds['low']
+    while low <= bounds['high']:
+        high = low + batch_size
+        with transaction.atomic(using=PRIMARY_DB):
+            purged += stale.filter(pk__gte=low, pk__lt=high)._raw_delete(PRIMARY_DB)
+        low = high
+        if pause:
+            time.sleep(pause)
+    return purged, time.monotonic() - started
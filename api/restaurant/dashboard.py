@@ -0,0 +1,88 @@
+"""
+Shop-owner dashboard: today's figures for every store a user owns.
+
+One query reads the stores with their restaurants, then one aggregate query
+per order shard counts the day's orders by status and sums their revenue for
+all of the owner's restaurants on that shard at once. The number of queries
+does not grow with the number of stores.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Order, Store
+from .sharding import shard_for_restaurant
+
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+CENTS = Decimal('0.01')
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def order_figures(restaurant_ids, day):
+    """
+    {restaurant_id: {'orders': {status: count, 'total': count}, 'revenue': Decimal}}
+    for the orders created on `day` (local time). Cancelled orders count as
+    orders but not as revenue.
+    """
+    start, end = _day_bounds(day)
+    by_shard = defaultdict(list)
+    for restaurant_id in restaurant_ids:
+        by_shard[shard_for_restaurant(restaurant_id)].append(restaurant_id)
+
+    counts = {status: Count('id', filter=Q(order_status=status)) for status in STATUSES}
+    figures = {}
+    for alias, ids in by_shard.items():
+        rows = (
+            Order.objects.using(alias)
+            .filter(restaurant_id__in=ids, created_at__gte=start, created_at__lt=end)
+            .values('restaurant_id')
+            .annotate(total=Count('id'), revenue=Sum('total_amount', filter=~Q(order_status='Cancelled')), **counts)
+            .order_by()
+        )
+        for row in rows:
+            figures[row['restaurant_id']] = {
+                'orders': {**{status: row[status] for status in STATUSES}, 'total': row['total']},
+                'revenue': row['revenue'] or Decimal('0.00'),
+            }
+    return figures
+
+
+def owner_dashboard(owner, day=None):
+    """
+    Dashboard document for all stores of `owner` on `day` (default: today).
+    """
+    day = day or timezone.localdate()
+    now = timezone.now()
+    stores = list(Store.objects.filter(owner=owner).select_related('restaurant').order_by('name'))
+    restaurants = [store.restaurant for store in stores if hasattr(store, 'restaurant')]
+    figures = order_figures([restaurant.pk for restaurant in restaurants], day)
+
+    empty = {'orders': {**dict.fromkeys(STATUSES, 0), 'total': 0}, 'revenue': Decimal('0.00')}
+    totals = {'orders': dict(empty['orders']), 'revenue': Decimal('0.00')}
+    entries = []
+    for store in stores:
+        restaurant = getattr(store, 'restaurant', None)
+        entry = {'store_id': store.pk, 'store_name': store.name, 'restaurant': None}
+        if restaurant is not None:
+            restaurant_figures = figures.get(restaurant.pk, empty)
+            entry['restaurant'] = {
+                'id': restaurant.pk,
+                'name': restaurant.name,
+                'is_active': restaurant.is_active,
+                'is_open': restaurant.is_open(now),
+                'orders': restaurant_figures['orders'],
+                'revenue': str(restaurant_figures['revenue'].quantize(CENTS)),
+            }
+            for key, count in restaurant_figures['orders'].items():
+                totals['orders'][key] += count
+            totals['revenue'] += restaurant_figures['revenue']
+        entries.append(entry)
+
+    return {'date': day, 'stores': entries, 'totals': {'orders': totals['orders'], 'revenue': str(totals['revenue'].quantize(CENTS))}}
@@ -0,0 +1,142 @@
+"""
+Idempotency keys for retried writes.
+
+A client that may retry a POST sends an ``Idempotency-Key`` header with a
+value unique to the operation (a UUID). The first request with a key runs
+normally and its response is stored in IdempotencyRecord; retries with the
+same key get that response back, marked with ``Idempotent-Replayed: true``,
+without the view running again. A retry arriving while the first request is
+still running waits for it instead of running in parallel. Reusing a key for
+a different request is rejected.
+
+Server errors (5xx and exceptions) are not stored, so the client can retry
+them. Requests without the header are not affected.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.routers import PRIMARY_DB
+
+from .models import IdempotencyRecord
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+# Back-off between checks while another request holds the key.
+_POLL_START, _POLL_MAX = 0.02, 0.5
+
+
+def request_hash(request):
+    """
+    Hash identifying what was asked: method, path and body.
+    """
+    try:
+        body = request.body
+    except RawPostDataException:
+        # The body stream was already parsed as a form.
+        body = json.dumps(request.data, sort_keys=True, default=str).encode()
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _claim(scope, key, fingerprint):
+    """
+    Try to become the request that runs for the key. Returns (record, True)
+    if this request should run, or (existing record, False).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic(using=PRIMARY_DB):
+            record = IdempotencyRecord.objects.using(PRIMARY_DB).create(
+                scope=scope, key=key, request_hash=fingerprint,
+                expires_at=now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    existing = IdempotencyRecord.objects.using(PRIMARY_DB).filter(scope=scope, key=key)
+    # An expired record, or one whose request never finished, frees the key.
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    existing.filter(expires_at__lte=now).delete()
+    existing.filter(status_code__isnull=True, created_at__lte=stale).delete()
+    return existing.first(), False
+
+
+def _await_outcome(scope, key, fingerprint):
+    """
+    Wait until the key is free to claim or its first request has finished.
+    Returns (record, claimed) like _claim, or (None, False) on timeout.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = _POLL_START
+    while True:
+        record, claimed = _claim(scope, key, fingerprint)
+        if claimed or (record is not None and (record.status_code is not None or record.request_hash != fingerprint)):
+            return record, claimed
+        if time.monotonic() + delay > deadline:
+            return None, False
+        time.sleep(delay)
+        delay = min(delay * 2, _POLL_MAX)
+
+
+def idempotent(scope):
+    """
+    Make a view's write method honour the Idempotency-Key header. Keys are
+    scoped to the endpoint and, when authenticated, to the user.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if not key:
+                return method(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+            user_scope = f'{scope}:{request.user.pk}' if request.user.is_authenticated else scope
+            fingerprint = request_hash(request)
+            record, claimed = _await_outcome(user_scope, key, fingerprint)
+            if not claimed:
+                if record is None:
+                    return Response({"error": "A request with this Idempotency-Key is still being processed"},
+                                    status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                if record.request_hash != fingerprint:
+                    return Response({"error": "This Idempotency-Key was already used for a different request"},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+            try:
+                response = method(view, request, *args, **kwargs)
+            except BaseException:
+                record.delete()
+                raise
+            if response.status_code >= 500 or not isinstance(response, Response):
+                record.delete()
+                return response
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_idempotency_records():
+    """
+    Delete expired records. Returns how many.
+    """
+    deleted, _ = IdempotencyRecord.objects.using(PRIMARY_DB).filter(expires_at__lte=timezone.now()).delete()
+    return deleted
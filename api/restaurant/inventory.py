@@ -0,0 +1,80 @@
+"""
+Stock reservation for menu items.
+
+A MenuItem with stock set is sold from a counter: adding it to an order takes
+units with a conditional UPDATE (... SET stock = stock - n WHERE stock > n),
+so concurrent checkouts can never oversell and no row is locked. Taking the
+last units is a second conditional UPDATE (WHERE stock = n) that also marks
+the item unavailable. Units go back when an order line is removed or its
+order is cancelled. Items with stock left empty are not tracked and are never
+written to.
+
+Only a change of is_available (the last units sold, or units back on a sold
+out item) is sent as a menu change. Plain count changes are not, so a busy
+item does not rebuild the menu snapshot on every order line.
+"""
+from django.db.models import F, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MenuItem, OrderItem
+from .signals import notify_menu_changed, order_status_changed
+
+# Orders whose lines still hold reserved stock.
+RESERVING_STATUSES = ('Pending', 'Processing')
+
+
+def reserve_stock(item, quantity):
+    """
+    Take quantity units of item (loaded with its menu). Returns False, without
+    writing anything, when fewer units are left.
+    """
+    if item.stock is None or quantity <= 0:
+        return True
+    items = MenuItem.objects.filter(pk=item.pk)
+    while True:
+        if items.filter(stock__gt=quantity).update(stock=F('stock') - quantity, updated_at=timezone.now()):
+            return True
+        # The last units: the item sells out.
+        if items.filter(stock=quantity).update(stock=0, is_available=False, updated_at=timezone.now()):
+            notify_menu_changed(item.menu.restaurant_id, [item.pk])
+            return True
+        # Both missed: not enough left, unless units came back in between.
+        if not items.filter(stock__gte=quantity).exists():
+            return False
+
+
+def release_stock(restaurant_id, quantities):
+    """
+    Give back units per item id ({item_id: quantity}); items that ran out
+    become available again.
+    """
+    quantities = {item_id: quantity for item_id, quantity in quantities.items() if quantity > 0}
+    restocked = []
+    for item_id, quantity in quantities.items():
+        items = MenuItem.objects.filter(pk=item_id)
+        while True:
+            if items.filter(stock__gt=0).update(stock=F('stock') + quantity, updated_at=timezone.now()):
+                break
+            # Back in stock after selling out.
+            if items.filter(stock=0).update(stock=quantity, is_available=True, updated_at=timezone.now()):
+                restocked.append(item_id)
+                break
+            # Both missed: untracked or deleted, unless the count moved in between.
+            if not items.filter(stock__isnull=False).exists():
+                break
+    if restocked:
+        notify_menu_changed(restaurant_id, restocked)
+
+
+@receiver(order_status_changed)
+def release_stock_on_cancel(sender, order, old_status, **kwargs):
+    if order.order_status == 'Cancelled' and old_status in RESERVING_STATUSES:
+        lines = (
+            OrderItem.objects.using(order._state.db)
+            .filter(order_id=order.pk)
+            .values('item_id')
+            .annotate(quantity=Sum('quantity'))
+            .order_by()
+        )
+        release_stock(order.restaurant_id, {line['item_id']: line['quantity'] for line in lines})
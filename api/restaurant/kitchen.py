@@ -0,0 +1,190 @@
+"""
+Kitchen queue: the Pending and Processing orders of each restaurant in the
+order the kitchen works through them, with a queue position and ETA for each.
+
+Every process keeps one queue per restaurant in memory. A queue is loaded from
+the restaurant's shard on first use (so a restart rebuilds it), kept current
+from the order signals of this process, and reloaded every
+KITCHEN_QUEUE_REFRESH_SECONDS to pick up changes made by other workers.
+
+Orders are kept in a list sorted by (stage, created_at, id): orders being
+prepared come first, then waiting orders first come, first served. Finding an
+order's position is a binary search. An insert or removal is a binary search
+plus a move of at most a few hundred pointers.
+
+ETAs use the median prep time (Processing to Delivered) of the restaurant's
+most recent orders and assume the kitchen works on KITCHEN_PARALLEL_ORDERS
+orders at a time.
+"""
+import statistics
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Order
+from .signals import order_status_changed
+
+# Sort rank of the statuses that are in the queue.
+STAGES = {'Processing': 0, 'Pending': 1}
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class KitchenQueue:
+    """
+    The active orders of one restaurant.
+    """
+
+    def __init__(self, restaurant_id, orders=(), prep_times=()):
+        self.restaurant_id = restaurant_id
+        self.loaded_at = time.monotonic()
+        self.prep_times = deque(prep_times, maxlen=settings.KITCHEN_PREP_SAMPLES)
+        self._lock = threading.Lock()
+        self._keys = []     # sorted (stage, created_at, order id)
+        self._orders = {}   # order id -> (key, processing_started_at)
+        for order_id, order_status, created_at, started_at in orders:
+            self.put(order_id, order_status, created_at, started_at)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def put(self, order_id, order_status, created_at, started_at=None):
+        """
+        Add or move an order; orders that are no longer active are dropped.
+        """
+        with self._lock:
+            self._discard(order_id)
+            if order_status in STAGES:
+                key = (STAGES[order_status], created_at, order_id)
+                insort(self._keys, key)
+                self._orders[order_id] = (key, started_at)
+
+    def discard(self, order_id):
+        with self._lock:
+            self._discard(order_id)
+
+    def _discard(self, order_id):
+        entry = self._orders.pop(order_id, None)
+        if entry is not None:
+            del self._keys[bisect_left(self._keys, entry[0])]
+
+    def record_prep_time(self, seconds):
+        if seconds >= 0:
+            self.prep_times.append(seconds)
+
+    def prep_seconds(self):
+        if not self.prep_times:
+            return settings.KITCHEN_DEFAULT_PREP_MINUTES * 60
+        return statistics.median(self.prep_times)
+
+    def _status(self, index, key, started_at, prep, now):
+        # Orders ahead of this one are cooked KITCHEN_PARALLEL_ORDERS at a time.
+        rounds_ahead = index // settings.KITCHEN_PARALLEL_ORDERS
+        remaining = prep
+        if started_at is not None:
+            remaining = max(prep - (now - started_at).total_seconds(), 0)
+        eta_seconds = round(rounds_ahead * prep + remaining)
+        return {
+            'order_id': key[2],
+            'order_status': 'Processing' if key[0] == STAGES['Processing'] else 'Pending',
+            'position': index + 1,
+            'eta_seconds': eta_seconds,
+            'eta': now + timedelta(seconds=eta_seconds),
+        }
+
+    def status(self, order_id):
+        """
+        Position and ETA of one order, or None if it is not in the queue.
+        """
+        now = timezone.now()
+        with self._lock:
+            entry = self._orders.get(order_id)
+            if entry is None:
+                return None
+            key, started_at = entry
+            return self._status(bisect_left(self._keys, key), key, started_at, self.prep_seconds(), now)
+
+    def statuses(self):
+        """
+        Position and ETA of every order, in queue order.
+        """
+        now = timezone.now()
+        with self._lock:
+            prep = self.prep_seconds()
+            return [
+                self._status(index, key, self._orders[key[2]][1], prep, now)
+                for index, key in enumerate(self._keys)
+            ]
+
+
+def load_queue(restaurant_id):
+    """
+    Build a restaurant's queue from its shard.
+    """
+    orders = Order.objects.for_restaurant(restaurant_id)
+    active = orders.filter(order_status__in=STAGES).values_list(
+        'id', 'order_status', 'created_at', 'processing_started_at',
+    )
+    recent = (
+        orders.filter(order_status='Delivered', processing_started_at__isnull=False)
+        .order_by('-updated_at')
+        .values_list('processing_started_at', 'updated_at')[:settings.KITCHEN_PREP_SAMPLES]
+    )
+    prep_times = [(delivered - started).total_seconds() for started, delivered in reversed(recent)]
+    return KitchenQueue(restaurant_id, active, [seconds for seconds in prep_times if seconds >= 0])
+
+
+def get_queue(restaurant_id):
+    """
+    The restaurant's queue, loaded or reloaded from the database as needed.
+    """
+    queue = _queues.get(restaurant_id)
+    if queue is None or time.monotonic() - queue.loaded_at > settings.KITCHEN_QUEUE_REFRESH_SECONDS:
+        queue = load_queue(restaurant_id)
+        with _queues_lock:
+            _queues[restaurant_id] = queue
+    return queue
+
+
+def _update_loaded_queue(restaurant_id, update):
+    # Queues that are not loaded pick the change up when they are.
+    queue = _queues.get(restaurant_id)
+    if queue is not None:
+        update(queue)
+
+
+@receiver(post_save, sender=Order)
+def track_saved_order(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: _update_loaded_queue(instance.restaurant_id, lambda queue: queue.put(
+            instance.pk, instance.order_status, instance.created_at, instance.processing_started_at,
+        )),
+        using=instance._state.db,
+    )
+
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_order(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: _update_loaded_queue(instance.restaurant_id, lambda queue: queue.discard(instance.pk)),
+        using=instance._state.db,
+    )
+
+
+@receiver(order_status_changed)
+def track_status_change(sender, order, old_status, **kwargs):
+    def update(queue):
+        if order.order_status == 'Delivered' and order.processing_started_at is not None:
+            queue.record_prep_time((order.updated_at - order.processing_started_at).total_seconds())
+        queue.put(order.pk, order.order_status, order.created_at, order.processing_started_at)
+
+    _update_loaded_queue(order.restaurant_id, update)
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.restaurant.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move Delivered/Cancelled orders older than the archive age into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age-days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help="Archive orders finished more than this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE,
+                            help="Orders moved per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running in the background, archiving every INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            archived = archive_orders(
+                age_days=options['age_days'],
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+            )
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders in {elapsed:.2f}s."))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
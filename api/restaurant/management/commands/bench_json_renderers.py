@@ -0,0 +1,100 @@
+import io
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.restaurant.models import CartItem, Menu, MenuItem, Order
+from api.restaurant.serializers import CartItemSerializer, MenuItemSerializer, MenuSerializer, OrderSerializer
+from core.renderers import ORJSONParser, ORJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSONRenderer/JSONParser with the orjson ones on menu, order "
+        "list and cart payloads: check the bytes match and report timings. "
+        "Payloads are built in memory, nothing touches the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menus', type=int, default=20, help="Categories in the full menu.")
+        parser.add_argument('--items', type=int, default=50, help="Items per category.")
+        parser.add_argument('--orders', type=int, default=500, help="Orders in the order list.")
+        parser.add_argument('--cart', type=int, default=30, help="Items in the cart.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per case; the best is reported.")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson is not installed; ORJSONRenderer falls back to the stdlib.")
+
+        payloads = {
+            'full menu': self.menu(options['menus'], options['items']),
+            'order list': self.orders(options['orders']),
+            'cart': self.cart(options['cart']),
+        }
+        for label, data in payloads.items():
+            expected = JSONRenderer().render(data)
+            rendered = ORJSONRenderer().render(data)
+            if rendered != expected:
+                raise CommandError(f"{label}: ORJSONRenderer output differs from JSONRenderer.")
+
+            repeat = options['repeat']
+            render = self.best_time(lambda: JSONRenderer().render(data), repeat)
+            fast_render = self.best_time(lambda: ORJSONRenderer().render(data), repeat)
+            parse = self.best_time(lambda: JSONParser().parse(io.BytesIO(expected)), repeat)
+            fast_parse = self.best_time(lambda: ORJSONParser().parse(io.BytesIO(expected)), repeat)
+            self.stdout.write(self.style.SUCCESS(
+                f"{label} ({len(expected) / 1024:.0f} KiB): identical output; "
+                f"render {render * 1000:.2f} -> {fast_render * 1000:.2f} ms ({render / fast_render:.1f}x), "
+                f"parse {parse * 1000:.2f} -> {fast_parse * 1000:.2f} ms ({parse / fast_parse:.1f}x)."
+            ))
+
+    def menu(self, menus, items):
+        now = timezone.now()
+        document = {'restaurant': 1, 'menus': []}
+        for menu_id in range(1, menus + 1):
+            menu = Menu(id=menu_id, restaurant_id=1, category_name=f'Category {menu_id}', created_at=now, updated_at=now)
+            menu_items = [
+                MenuItem(
+                    id=menu_id * items + index, menu_id=menu_id, name=f'Dish {index} – spécial',
+                    description='Slow-cooked, served with rice and salad. ' * 3, price=Decimal(index % 40 * 10) + Decimal('0.50'),
+                    image_url=f'https://cdn.example.com/menu/{menu_id}/{index}.jpg', is_available=index % 7 != 0,
+                    is_vegetarian=index % 2 == 0, created_at=now - timedelta(days=index), updated_at=now,
+                )
+                for index in range(items)
+            ]
+            document['menus'].append({**MenuSerializer(menu).data, 'menu_items': MenuItemSerializer(menu_items, many=True).data})
+        return document
+
+    def orders(self, count):
+        now = timezone.now()
+        orders = [
+            Order(
+                id=index, restaurant_id=1, user_id=index % 97 + 1, order_date=now - timedelta(minutes=index),
+                delivery_address=f'{index} Main Street, Springfield', order_status='Delivered',
+                total_amount=Decimal(index % 300) + Decimal('0.99'), payment_method='card',
+                created_at=now - timedelta(minutes=index), updated_at=now,
+            )
+            for index in range(1, count + 1)
+        ]
+        return OrderSerializer(orders, many=True).data
+
+    def cart(self, count):
+        now = timezone.now()
+        items = [
+            CartItem(id=index, user_id=1, store_id=1, item_id=index * 3, quantity=index % 4 + 1, added_at=now - timedelta(hours=index))
+            for index in range(1, count + 1)
+        ]
+        return CartItemSerializer(items, many=True).data
+
+    def best_time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
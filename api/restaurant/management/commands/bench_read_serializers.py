@@ -0,0 +1,71 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.restaurant.models import CartItem, Menu, MenuItem, Restaurant, Store
+from api.restaurant.serializers import CartItemSerializer, MenuItemSerializer, ValuesSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Report ModelSerializer and ValuesSerializer CPU time per 1,000 menu item "
+        "and cart rows (api/restaurant/tests.py checks that their output is "
+        "identical). Works on throwaway rows inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per list.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the best is reported.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            menu_items, cart_items = self.make_rows(options['rows'])
+            for label, serializer_class, queryset in (
+                ('menu items', MenuItemSerializer, menu_items),
+                ('cart items', CartItemSerializer, cart_items),
+            ):
+                self.compare(label, serializer_class, queryset, options['rows'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def make_rows(self, count):
+        suffix = uuid.uuid4().hex[:12]
+        user = get_user_model().objects.create(username=f'bench-{suffix}')
+        store = Store.objects.create(owner=user, name=f'bench-{suffix}')
+        restaurant = Restaurant.objects.create(
+            store=store, name='bench', address='-', city='-', state='-', pincode='000000',
+            opening_time='09:00', closing_time='22:00',
+        )
+        menu = Menu.objects.create(restaurant=restaurant, category_name='bench')
+        items = MenuItem.objects.bulk_create(
+            MenuItem(
+                menu=menu, name=f'item {index}', description='x' * 200, price=Decimal(index % 500) + Decimal('0.99'),
+                image_url=f'https://example.com/{index}.png' if index % 2 else None, is_available=bool(index % 3),
+            )
+            for index in range(count)
+        )
+        CartItem.objects.bulk_create(
+            CartItem(user=user, store=store, item=item, quantity=index % 5 + 1) for index, item in enumerate(items)
+        )
+        return MenuItem.objects.filter(menu=menu), CartItem.objects.filter(user=user)
+
+    def compare(self, label, serializer_class, queryset, rows, repeat):
+        slow_time = self.best_time(lambda: serializer_class(queryset.all(), many=True).data, repeat)
+        fast_time = self.best_time(lambda: ValuesSerializer(serializer_class).serialize(queryset.all()), repeat)
+        per_thousand = 1000 / rows * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {serializer_class.__name__} {slow_time * per_thousand:.1f} ms, "
+            f"ValuesSerializer {fast_time * per_thousand:.1f} ms CPU per 1,000 rows "
+            f"({slow_time / fast_time:.1f}x)."
+        ))
+
+    def best_time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            func()
+            timings.append(time.process_time() - start)
+        return min(timings)
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.restaurant.carts import expire_stale_carts
+
+
+class Command(BaseCommand):
+    help = "Delete cart items that were added longer ago than the cart TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-hours', type=int, default=settings.CART_TTL_HOURS,
+                            help="Expire cart items older than this many hours.")
+        parser.add_argument('--batch-size', type=int, default=settings.CART_EXPIRY_BATCH_SIZE,
+                            help="Width of each primary-key range deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running, expiring carts every INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            purged, elapsed = expire_stale_carts(
+                ttl_hours=options['ttl_hours'],
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+            )
+            self.stdout.write(self.style.SUCCESS(f"Purged {purged} cart items in {elapsed:.2f}s."))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
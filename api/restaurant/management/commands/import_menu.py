@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.restaurant.menu_io import FORMATS, MenuImportError, guess_format, import_menu, iter_rows
+from api.restaurant.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Bulk-import a restaurant menu from a CSV, JSON or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('store_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="File format (default: from the file extension).")
+        parser.add_argument('--batch-size', type=int, default=settings.MENU_IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Show what would change without writing.")
+
+    def handle(self, *args, **options):
+        try:
+            restaurant = Restaurant.objects.get(store_id=options['store_id'])
+        except Restaurant.DoesNotExist:
+            raise CommandError("Restaurant not found for the given store_id")
+
+        fmt = options['format'] or guess_format(options['path'])
+        started = time.monotonic()
+        with open(options['path'], 'rb') as fileobj:
+            try:
+                report = import_menu(
+                    restaurant,
+                    iter_rows(fileobj, fmt),
+                    dry_run=options['dry_run'],
+                    batch_size=options['batch_size'],
+                )
+            except (MenuImportError, ValueError) as exc:
+                raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+
+        if report['errors']:
+            self.stderr.write(json.dumps(report['errors'], indent=2))
+            raise CommandError(f"{len(report['errors'])} invalid rows, nothing imported.")
+        if options['dry_run']:
+            self.stdout.write(json.dumps(report['changes'], indent=2))
+
+        rate = report['rows'] / elapsed if elapsed else report['rows']
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/s): "
+            f"{report['created']} created, {report['updated']} updated, {report['unchanged']} unchanged"
+            f"{' (dry run)' if options['dry_run'] else ''}."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.restaurant.idempotency import purge_idempotency_records
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key outcomes that have expired."
+
+    def handle(self, *args, **options):
+        purged = purge_idempotency_records()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} idempotency records."))
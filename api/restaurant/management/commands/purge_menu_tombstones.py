@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.restaurant.menu_sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete menu tombstones older than the delta sync retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MENU_TOMBSTONE_RETENTION_DAYS,
+                            help="Keep tombstones for this many days.")
+
+    def handle(self, *args, **options):
+        purged = purge_tombstones(retention_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} menu tombstones."))
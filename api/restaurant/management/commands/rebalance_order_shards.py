@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from api.restaurant.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from api.restaurant.sharding import copy_rows, order_databases, reset_sequences, shard_for_restaurant
+
+# Order models moved together with their items.
+MODELS = [(Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move orders, archived orders and their items that sit on the wrong "
+        "shard to the shard of their restaurant. Also moves orders off the "
+        "'default' database when it is no longer a shard. To shard a single "
+        "database: set ORDER_SHARD_URLS, run `manage.py migrate --database "
+        "orders_N` for every shard, deploy, then run this command. Orders "
+        "still on 'default' are not visible to the API until it has moved "
+        "them, so run it straight after the deploy. It is safe to rerun after "
+        "an interruption."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Orders moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be moved.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        moved = 0
+        touched = set()
+
+        for source in order_databases():
+            for model, item_model in MODELS:
+                restaurant_ids = (
+                    model.objects.using(source)
+                    .order_by()
+                    .values_list('restaurant_id', flat=True)
+                    .distinct()
+                )
+                for restaurant_id in list(restaurant_ids):
+                    target = shard_for_restaurant(restaurant_id)
+                    if target == source:
+                        continue
+
+                    label = f"restaurant {restaurant_id}: {model._meta.verbose_name_plural}"
+                    pending = model.objects.using(source).filter(restaurant_id=restaurant_id)
+                    if dry_run:
+                        count = pending.count()
+                        self.stdout.write(f"{label}: {count} {source} -> {target}")
+                        moved += count
+                        continue
+
+                    try:
+                        count = self.move_restaurant(model, item_model, pending, source, target, batch_size)
+                    except IntegrityError as exc:
+                        self.stderr.write(f"{label}: id collision on {target}, skipped ({exc})")
+                        continue
+                    self.stdout.write(f"{label}: moved {count} {source} -> {target}")
+                    moved += count
+                    touched.add(target)
+
+        for alias in touched:
+            reset_sequences([model for pair in MODELS for model in pair], alias)
+
+        verb = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} orders."))
+
+    def move_restaurant(self, model, item_model, pending, source, target, batch_size):
+        """
+        Copy orders to the target shard batch by batch. The target commits
+        before the source deletes, so a failure leaves the rows on both
+        databases rather than on neither, and the next run finishes the move.
+        """
+        moved = 0
+        while True:
+            with transaction.atomic(using=source), transaction.atomic(using=target):
+                orders = list(pending.order_by('pk')[:batch_size])
+                if not orders:
+                    return moved
+                order_ids = [order.pk for order in orders]
+                copied = self.copied(model, orders, target)
+                missing = [order.pk for order in orders if order.pk not in copied]
+                items = list(item_model.objects.using(source).filter(order_id__in=missing))
+
+                copy_rows(model, [order for order in orders if order.pk not in copied], target)
+                copy_rows(item_model, items, target)
+
+                item_model.objects.using(source).filter(order_id__in=order_ids)._raw_delete(source)
+                model.objects.using(source).filter(pk__in=order_ids)._raw_delete(source)
+            moved += len(orders)
+
+    def copied(self, model, orders, target):
+        """
+        Ids of `orders` that an interrupted run already committed to the
+        target. Ids are unique across shards (sharding.next_id), so a
+        different order under the same id means rows were inserted with
+        explicit ids, and the restaurant is left for a manual fix.
+        """
+        existing = dict(
+            model.objects.using(target)
+            .filter(pk__in=[order.pk for order in orders])
+            .values_list('pk', 'restaurant_id')
+        )
+        for order in orders:
+            if order.pk in existing and existing[order.pk] != order.restaurant_id:
+                raise IntegrityError(f"{model.__name__} {order.pk} exists on {target} for another restaurant")
+        return set(existing)
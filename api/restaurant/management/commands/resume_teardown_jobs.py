@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.restaurant.models import TeardownJob
+from api.restaurant.teardown import run_teardown
+
+
+class Command(BaseCommand):
+    help = "Run (or resume) restaurant teardown jobs that have not finished."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, help="Only run the job with this id.")
+        parser.add_argument('--batch-size', type=int, help="Rows deleted per batch.")
+
+    def handle(self, *args, **options):
+        jobs = TeardownJob.objects.using('default').exclude(status=TeardownJob.Status.DONE)
+        if options['job']:
+            jobs = jobs.filter(pk=options['job'])
+
+        for job in jobs.order_by('created_at'):
+            self.stdout.write(f"Running teardown job {job.pk} for restaurant {job.restaurant_id}...")
+            try:
+                job = run_teardown(job.pk, batch_size=options['batch_size'])
+            except Exception as exc:
+                self.stderr.write(f"Job {job.pk} failed: {exc}")
+                continue
+            self.stdout.write(self.style.SUCCESS(f"Job {job.pk} done: {job.deleted}"))
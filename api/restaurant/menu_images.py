@@ -0,0 +1,71 @@
+"""
+Image variants for menu items.
+
+When a menu item's image_url changes (single edits, batch updates, bulk
+imports), the image is fetched and resized on the 'images' background pool
+(see core/images.py), away from the pool that rebuilds snapshots. The URLs of the variants are stored in image_variants together
+with the image_url they were made from, and a menu change is sent so delta
+sync clients and the menu snapshot pick them up.
+"""
+import logging
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.images import ImageError, build_variants, fetch_image
+from core.routers import use_primary
+
+from .models import MenuItem
+from .signals import menu_changed, notify_menu_changed
+from .tasks import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_PREFIX = 'menu_items/variants'
+
+
+def needs_variants(image_url, image_variants):
+    return (image_variants or {}).get('source') != (image_url or None)
+
+
+def build_menu_item_variants(item_id, restaurant_id, image_url):
+    variants = {}
+    if image_url:
+        try:
+            variants = build_variants(fetch_image(image_url), VARIANTS_PREFIX)
+        except ImageError as exc:
+            logger.warning("No image variants for menu item %s: %s", item_id, exc)
+    # Only if the image was not changed again in the meantime.
+    if MenuItem.objects.filter(pk=item_id, image_url=image_url).update(
+        image_variants={'source': image_url or None, 'variants': variants},
+        updated_at=timezone.now(),
+    ):
+        notify_menu_changed(restaurant_id, [item_id])
+
+
+def _refresh_menu_images(restaurant_id, item_ids):
+    # Runs right after the change committed: a replica may not have it yet.
+    with use_primary():
+        items = MenuItem.objects.filter(menu__restaurant_id=restaurant_id)
+        if item_ids is not None:
+            items = items.filter(pk__in=item_ids)
+        stale = [
+            (item_id, image_url)
+            for item_id, image_url, image_variants in items.values_list('pk', 'image_url', 'image_variants')
+            if needs_variants(image_url, image_variants)
+        ]
+    for item_id, image_url in stale:
+        build_menu_item_variants(item_id, restaurant_id, image_url)
+
+
+@receiver(post_save, sender=MenuItem)
+def queue_menu_item_variants(sender, instance, **kwargs):
+    if needs_variants(instance.image_url, instance.image_variants):
+        run_in_pool('images', build_menu_item_variants, instance.pk, instance.menu.restaurant_id, instance.image_url)
+
+
+@receiver(menu_changed)
+def queue_changed_menu_images(sender, restaurant_id, item_ids=None, **kwargs):
+    # Batch updates and imports write without post_save.
+    run_in_pool('images', _refresh_menu_images, restaurant_id, item_ids)
@@ -0,0 +1,227 @@
+"""
+Bulk menu import and export.
+
+A menu file has one row per menu item; the category column names the Menu it
+belongs to. Supported formats are CSV (with a header row), JSON Lines (one
+object per line) and a JSON array. CSV and JSON Lines are parsed as a stream.
+
+Rows are validated and written in batches inside a single transaction.
+Categories are matched on category_name and items on (category, name); rows
+that match nothing are created with bulk_create, changed items are saved with
+bulk_update. Names are not unique in the database, so where a menu already
+has duplicates the oldest category is used and every matching item is
+updated. If any row is invalid nothing is written. A dry run computes the same
+diff and rolls back.
+"""
+import csv
+import io
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from core.routers import use_primary
+
+from .models import Menu, MenuItem
+from .signals import notify_menu_changed
+
+COLUMNS = ['category_name', 'name', 'description', 'price', 'image_url', 'is_available', 'is_vegetarian']
+ITEM_FIELDS = ['description', 'price', 'image_url', 'is_available', 'is_vegetarian']
+FORMATS = ('csv', 'json', 'jsonl')
+MAX_REPORTED_CHANGES = 100
+
+
+class MenuImportRowSerializer(serializers.Serializer):
+    """
+    Validates one row of a menu file.
+    """
+    category_name = serializers.CharField(max_length=100)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True, default=None)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    image_url = serializers.URLField(required=False, allow_blank=True, allow_null=True, default=None)
+    is_available = serializers.BooleanField(default=True)
+    is_vegetarian = serializers.BooleanField(default=True)
+
+
+class MenuImportError(Exception):
+    pass
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+
+def iter_rows(fileobj, fmt):
+    """
+    Yield one dict per row of a binary file object.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+        rows = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                raise MenuImportError(f"Malformed CSV at row {rows + 1}: {exc}")
+            rows += 1
+            # Empty cells mean "use the default", not an empty value.
+            yield {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif fmt == 'jsonl':
+        for line in io.TextIOWrapper(fileobj, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        rows = json.load(fileobj)
+        if not isinstance(rows, list):
+            raise MenuImportError("A JSON menu file must contain a list of rows.")
+        yield from rows
+    else:
+        raise MenuImportError(f"Unsupported format '{fmt}', use one of: {', '.join(FORMATS)}.")
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _diff(existing, row):
+    return {
+        field: {'old': _json_value(existing[field]), 'new': _json_value(row[field])}
+        for field in ITEM_FIELDS
+        if existing[field] != row[field]
+    }
+
+
+def import_menu(restaurant, rows, dry_run=False, batch_size=None):
+    """
+    Upsert menus and menu items of restaurant from an iterable of row dicts.
+    Returns a report with counts, the first changes and any row errors.
+    """
+    batch_size = batch_size or settings.MENU_IMPORT_BATCH_SIZE
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'changes': [], 'errors': [], 'dry_run': dry_run}
+    with use_primary(), transaction.atomic():
+        # Newest first, so the oldest of any duplicate categories wins.
+        menu_ids = dict(restaurant.menus.order_by('-id').values_list('category_name', 'id'))
+        for batch in _batches(rows, batch_size):
+            offset = report['rows']
+            report['rows'] += len(batch)
+
+            serializer = MenuImportRowSerializer(data=batch, many=True)
+            if not serializer.is_valid():
+                report['errors'].extend(
+                    {'row': offset + index + 1, 'errors': errors}
+                    for index, errors in enumerate(serializer.errors) if errors
+                )
+            if report['errors']:
+                # Keep validating to report every bad row, but stop writing.
+                continue
+
+            # The last occurrence of a (category, name) pair wins.
+            validated = {(row['category_name'], row['name']): row for row in serializer.validated_data}
+            now = timezone.now()
+
+            new_categories = {category for category, _ in validated} - menu_ids.keys()
+            if new_categories:
+                created = Menu.objects.bulk_create(
+                    [Menu(restaurant=restaurant, category_name=category) for category in sorted(new_categories)]
+                )
+                if any(menu.pk is None for menu in created):
+                    # Backends that cannot return ids from a bulk insert.
+                    created = restaurant.menus.filter(category_name__in=new_categories).order_by('-id')
+                menu_ids.update((menu.category_name, menu.pk) for menu in created)
+
+            categories = {menu_id: category for category, menu_id in menu_ids.items()}
+            existing = {}
+            for item in MenuItem.objects.filter(
+                menu_id__in={menu_ids[category] for category, _ in validated},
+                name__in={name for _, name in validated},
+            ).order_by('id').values('id', 'menu_id', 'name', *ITEM_FIELDS):
+                existing.setdefault((categories[item['menu_id']], item['name']), []).append(item)
+
+            creates, updates = [], []
+            for key, row in validated.items():
+                matches = existing.get(key)
+                if not matches:
+                    report['created'] += 1
+                    change = {'action': 'create'}
+                    creates.append(MenuItem(
+                        menu_id=menu_ids[row['category_name']],
+                        name=row['name'],
+                        **{field: row[field] for field in ITEM_FIELDS},
+                    ))
+                else:
+                    changed = [item for item in matches if _diff(item, row)]
+                    if not changed:
+                        report['unchanged'] += 1
+                        continue
+                    report['updated'] += 1
+                    change = {'action': 'update', 'fields': _diff(changed[0], row)}
+                    updates += [
+                        MenuItem(id=item['id'], updated_at=now, **{field: row[field] for field in ITEM_FIELDS})
+                        for item in changed
+                    ]
+                if len(report['changes']) < MAX_REPORTED_CHANGES:
+                    report['changes'].append({'category_name': key[0], 'name': key[1], **change})
+
+            if creates:
+                MenuItem.objects.bulk_create(creates)
+            if updates:
+                MenuItem.objects.bulk_update(updates, [*ITEM_FIELDS, 'updated_at'])
+
+        if report['created'] or report['updated']:
+            # Dropped with the transaction on a dry run or failed import.
+            notify_menu_changed(restaurant.pk)
+        if dry_run or report['errors']:
+            transaction.set_rollback(True)
+    return report
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _export_rows(restaurant):
+    return (
+        MenuItem.objects.filter(menu__restaurant=restaurant)
+        .order_by('menu__category_name', 'name')
+        .values_list('menu__category_name', 'name', *ITEM_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+
+
+def _json_value(value):
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def export_menu(restaurant, fmt):
+    """
+    Yield the restaurant's menu as chunks of text in the import file format.
+    """
+    rows = _export_rows(restaurant)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(COLUMNS, map(_json_value, row)))) + '\n'
+    elif fmt == 'json':
+        yield '['
+        for index, row in enumerate(rows):
+            yield (',' if index else '') + json.dumps(dict(zip(COLUMNS, map(_json_value, row))))
+        yield ']'
+    else:
+        raise MenuImportError(f"Unsupported format '{fmt}', use one of: {', '.join(FORMATS)}.")
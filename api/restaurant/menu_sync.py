@@ -0,0 +1,117 @@
+"""
+Delta sync of a restaurant's menus for offline clients.
+
+Menus, menu items and tombstones are read as three streams ordered by
+(updated_at, id) (deleted_at for tombstones) and paged with keyset filters, so
+a sync only touches rows that changed after the client's position. The
+position of every stream is returned as an opaque cursor.
+
+Rows newer than settings.MENU_SYNC_SETTLE_SECONDS are held back until the next
+sync: updated_at is taken before commit, so a slower transaction can commit a
+row whose timestamp is older than one a client has already seen.
+"""
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Menu, MenuItem, MenuTombstone
+from .serializers import MenuItemSerializer, MenuSerializer
+
+STREAMS = ('menus', 'menu_items', 'deleted')
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(positions):
+    data = {name: [value.isoformat(), pk] for name, (value, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = {name: (parse_datetime(data[name][0]), int(data[name][1])) for name in STREAMS}
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise CursorError("Invalid cursor.")
+    if any(value is None for value, _ in positions.values()):
+        raise CursorError("Invalid cursor.")
+    return positions
+
+
+def _page(queryset, field, position, horizon, limit):
+    """
+    Up to `limit` rows after `position` and not newer than `horizon`,
+    plus whether more rows are waiting.
+    """
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}))
+    rows = list(queryset.filter(**{f'{field}__lte': horizon}).order_by(field, 'id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def menu_changes(restaurant, since=None, cursor=None, limit=None):
+    """
+    Menus and menu items of restaurant changed after the given point, and the
+    ids deleted since then. `cursor` (from a previous response) takes
+    precedence over `since`; with neither, the whole menu is returned.
+    """
+    limit = max(1, min(limit or settings.MENU_SYNC_PAGE_SIZE, settings.MENU_SYNC_PAGE_SIZE))
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.MENU_SYNC_SETTLE_SECONDS)
+
+    if cursor:
+        positions = decode_cursor(cursor)
+    elif since:
+        positions = dict.fromkeys(STREAMS, (since, 0))
+    else:
+        positions = None
+
+    # Tombstones are only kept for a while; older clients must start over.
+    retained_since = now - timedelta(days=settings.MENU_TOMBSTONE_RETENTION_DAYS)
+    full_sync = positions is None or positions['deleted'][0] < retained_since
+    if full_sync:
+        # A fresh copy has nothing to delete: only tombstones from here on matter.
+        positions = {'menus': None, 'menu_items': None, 'deleted': (horizon, 0)}
+
+    streams = (
+        ('menus', Menu.objects.filter(restaurant=restaurant), 'updated_at'),
+        ('menu_items', MenuItem.objects.filter(menu__restaurant=restaurant), 'updated_at'),
+        ('deleted', MenuTombstone.objects.filter(restaurant_id=restaurant.pk), 'deleted_at'),
+    )
+    pages, has_more = {}, False
+    for name, queryset, field in streams:
+        rows, more = _page(queryset, field, positions[name], horizon, limit)
+        pages[name] = rows
+        has_more = has_more or more
+        last = (getattr(rows[-1], field), rows[-1].pk) if rows else positions[name]
+        if not more and (last is None or last[0] < horizon):
+            # Caught up: move to the horizon so quiet streams do not age out.
+            last = (horizon, 0)
+        positions[name] = last
+
+    return {
+        'full_sync': full_sync,
+        'menus': MenuSerializer(pages['menus'], many=True).data,
+        'menu_items': MenuItemSerializer(pages['menu_items'], many=True).data,
+        'deleted': [{'kind': row.kind, 'id': row.object_id} for row in pages['deleted']],
+        'has_more': has_more,
+        'cursor': encode_cursor(positions),
+    }
+
+
+def purge_tombstones(retention_days=None):
+    """
+    Delete tombstones older than the retention window. Returns how many.
+    """
+    retention_days = settings.MENU_TOMBSTONE_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = MenuTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
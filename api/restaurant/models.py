@@ -1,9 +1,13 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
+from .sharding import SHARD_CASCADE, merge_by, next_id, order_shards, shard_for_restaurant
+
 
 
 
@@ -85,6 +89,18 @@ class Restaurant(models.Model):
     def __str__(self):
         return f"{self.name} - {self.store.name})"
 
+    def is_open(self, at=None):
+        """
+        Whether the restaurant is active and within its opening hours at `at`
+        (default: now). Hours past midnight (e.g. 18:00-02:00) are supported.
+        """
+        if not self.is_active:
+            return False
+        now = timezone.localtime(at).time()
+        if self.opening_time <= self.closing_time:
+            return self.opening_time <= now < self.closing_time
+        return now >= self.opening_time or now < self.closing_time
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = "restaurant"
@@ -101,6 +117,11 @@ class Menu(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the restaurant was created"))
     updated_at = models.DateTimeField(auto_now=True, help_text=_("Last updated timestamp"))
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the menu delta sync.
+            models.Index(fields=['updated_at', 'id'], name='menu_sync_idx'),
+        ]
 
     def __str__(self):
         return self.category_name
@@ -111,16 +132,128 @@ class MenuItem(models.Model):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image_url = models.URLField(blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, help_text=_("Resized copies of image_url: {'source': url, 'variants': {size: {format: url}}}"))
     is_available = models.BooleanField(default=True)
     is_vegetarian = models.BooleanField(default=True)
+    stock = models.PositiveIntegerField(blank=True, null=True, help_text=_("Units left to sell; empty means stock is not tracked"))
     created_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the restaurant was created"))
     updated_at = models.DateTimeField(auto_now=True, help_text=_("Last updated timestamp"))
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the menu delta sync.
+            models.Index(fields=['updated_at', 'id'], name='menu_item_sync_idx'),
+        ]
 
     def __str__(self):
         return self.name
-    
-    
+
+
+class MenuTombstone(models.Model):
+    """
+    Records a deleted Menu or MenuItem so that the delta sync can tell clients
+    to drop it. A deleted menu implies that all of its items are gone too.
+    """
+    class Kind(models.TextChoices):
+        MENU = 'menu', _('Menu')
+        MENU_ITEM = 'menu_item', _('Menu item')
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    restaurant_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the object was deleted"))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant_id', 'deleted_at', 'id'], name='menu_tombstone_sync_idx'),
+            models.Index(fields=['deleted_at'], name='menu_tombstone_purge_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class ShardIdSequence(models.Model):
+    """
+    Next free id of a sharded model (see sharding.next_id). Lives on the
+    primary database so that ids are unique across every shard.
+    """
+    name = models.CharField(max_length=100, primary_key=True, help_text=_("model_name of the sharded model"))
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
+
+
+def assign_ids(model, objs):
+    """
+    Give unsaved objs of a sharded model an id from its sequence.
+    """
+    objs = list(objs)
+    for obj in objs:
+        if obj.pk is None:
+            obj.pk = next_id(model)
+    return objs
+
+
+class OrderQuerySet(models.QuerySet):
+    def for_restaurant(self, restaurant_id):
+        """
+        Orders of one restaurant, read from the shard that holds them.
+        """
+        return self.using(shard_for_restaurant(restaurant_id)).filter(restaurant_id=restaurant_id)
+
+    def create(self, **kwargs):
+        # QuerySet.create() saves with an explicit alias, which would bypass the
+        # shard router; resolve the shard from the restaurant instead.
+        if self._db is None:
+            restaurant = kwargs.get('restaurant')
+            restaurant_id = restaurant.pk if restaurant is not None else kwargs.get('restaurant_id')
+            if restaurant_id is not None:
+                return super(OrderQuerySet, self.using(shard_for_restaurant(restaurant_id))).create(**kwargs)
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        return super().bulk_create(assign_ids(self.model, objs), *args, **kwargs)
+
+    def update_if_current(self, order, **changes):
+        """
+        Apply changes to order with one conditional UPDATE that only matches
+        while the row still has the status and version order was read with.
+        Bumps the version. Returns False if someone else got there first.
+        No row lock is taken.
+        """
+        updated = self.using(order._state.db).filter(
+            pk=order.pk, order_status=order.order_status, version=order.version,
+        ).update(version=models.F('version') + 1, **{'updated_at': timezone.now(), **changes})
+        return updated == 1
+
+
+class OrderManager(models.Manager.from_queryset(OrderQuerySet)):
+    def for_user(self, user_id, archived=True, limit=50, before=None):
+        """
+        Order history of a user across every shard, newest first. Archived
+        orders are included as ArchivedOrder instances unless archived=False.
+
+        Returns at most `limit` orders. For the next page pass the
+        (created_at, id) of the last order returned as `before`; ids are
+        unique across shards and the archive, so the cursor never skips or
+        repeats an order. Every shard is limited before the merge.
+        """
+        querysets = [self.using(alias) for alias in order_shards()]
+        if archived:
+            querysets += [ArchivedOrder.objects.using(alias) for alias in order_shards()]
+        querysets = [queryset.filter(user_id=user_id).order_by('-created_at', '-id') for queryset in querysets]
+        if before is not None:
+            created_at, order_id = before
+            querysets = [
+                queryset.filter(models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, id__lt=order_id))
+                for queryset in querysets
+            ]
+        querysets = [queryset[:limit] for queryset in querysets]
+        return merge_by(querysets, key=('created_at', 'id'), reverse=True, limit=limit)
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ("Pending", "Pending"),
@@ -128,41 +261,205 @@ class Order(models.Model):
         ("Delivered", "Delivered"),
         ("Cancelled", "Cancelled"),
     ]
-
-    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="orders")
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders")
+    # Allowed status changes; Delivered and Cancelled are final.
+    STATUS_TRANSITIONS = {
+        "Pending": {"Processing", "Cancelled"},
+        "Processing": {"Delivered", "Cancelled"},
+        "Delivered": set(),
+        "Cancelled": set(),
+    }
+
+    # Orders may live on a different database (shard) than restaurants, users and
+    # menu items, so these foreign keys carry no database constraint and cascade
+    # through SHARD_CASCADE instead.
+    restaurant = models.ForeignKey(Restaurant, on_delete=SHARD_CASCADE, db_constraint=False, related_name="orders")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=SHARD_CASCADE, db_constraint=False, related_name="orders")
     order_date = models.DateTimeField(auto_now_add=True)
     delivery_address = models.TextField(blank=True, null=True)
     order_status = models.CharField(max_length=50, choices=STATUS_CHOICES, default="Pending")
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     payment_method = models.CharField(max_length=50, blank=True, null=True)
+    version = models.PositiveIntegerField(default=0, help_text=_("Incremented on every update, for optimistic concurrency"))
+    processing_started_at = models.DateTimeField(blank=True, null=True, help_text=_("Time when the kitchen started the order"))
     created_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the restaurant was created"))
     updated_at = models.DateTimeField(auto_now=True, help_text=_("Last updated timestamp"))
 
+    objects = OrderManager()
+
+    class Meta:
+        indexes = [
+            # Lets the archiver find finished orders without scanning the table.
+            models.Index(fields=['order_status', 'updated_at'], name='order_status_updated_idx'),
+            # Admin date hierarchy and newest-first listing.
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Plain saves (admin, shell) count as updates too, so optimistic
+        # writers holding the old version notice them.
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        elif self.pk is None:
+            # Ids come from a sequence shared by all shards, not the shard's own.
+            self.pk = next_id(Order)
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"Order {self.id} - {self.user.username}"
+        # Users live on the default database, orders on shards: no lookup here.
+        return f"Order {self.id} - user {self.user_id}"
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Order items are written to the shard their order was loaded from.
+        order = kwargs.get('order')
+        if self._db is None and order is not None and order._state.db:
+            return super(OrderItemQuerySet, self.using(order._state.db)).create(**kwargs)
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        return super().bulk_create(assign_ids(self.model, objs), *args, **kwargs)
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
-    item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name="order_items")
+    item = models.ForeignKey(MenuItem, on_delete=SHARD_CASCADE, db_constraint=False, related_name="order_items")
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     special_instructions = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the restaurant was created"))
     updated_at = models.DateTimeField(auto_now=True, help_text=_("Last updated timestamp"))
 
+    objects = OrderItemQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.pk is None:
+            self.pk = next_id(OrderItem)
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.quantity} x {self.item.name}"
+        return f"{self.quantity} x {self.item_id}"
     
     
+class ArchivedOrder(models.Model):
+    """
+    Cold copy of a Delivered/Cancelled order, moved out of the Order table by
+    the archiver (see archive.py). Keeps the original id and timestamps and
+    lives on the same shard as the restaurant's live orders.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    restaurant = models.ForeignKey(Restaurant, on_delete=SHARD_CASCADE, db_constraint=False, related_name="archived_orders")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=SHARD_CASCADE, db_constraint=False, related_name="archived_orders")
+    order_date = models.DateTimeField()
+    delivery_address = models.TextField(blank=True, null=True)
+    order_status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_method = models.CharField(max_length=50, blank=True, null=True)
+    version = models.PositiveIntegerField(default=0)
+    processing_started_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True, help_text=_("Time when the order was archived"))
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="items")
+    item = models.ForeignKey(MenuItem, on_delete=SHARD_CASCADE, db_constraint=False, related_name="archived_order_items")
+    quantity = models.IntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    special_instructions = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.item_id} (archived)"
+
+
 class CartItem(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cart_items")
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="cart_items")
     item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name="cart_items")
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
-    added_at = models.DateTimeField(auto_now_add=True)
+    added_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.item.name} ({self.quantity})"
+
+
+class TeardownJob(models.Model):
+    """
+    Background deletion of a restaurant (and optionally its store).
+    Progress is stored per table so an interrupted job can be resumed.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    # Plain ids, not foreign keys: the rows they point to are what the job deletes.
+    restaurant_id = models.BigIntegerField(help_text=_("Restaurant being deleted"))
+    store_id = models.BigIntegerField(help_text=_("Store the restaurant belongs to"))
+    delete_store = models.BooleanField(default=False, help_text=_("Also delete the store once the restaurant is gone"))
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    deleted = models.JSONField(default=dict, help_text=_("Rows deleted so far, per table"))
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Teardown of restaurant {self.restaurant_id} ({self.status})"
+
+
+class MenuSnapshot(models.Model):
+    """
+    A restaurant's full menu rendered once to JSON and stored as bytes, with
+    compressed variants, so menu reads skip the serializers entirely.
+    """
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, related_name='menu_snapshot')
+    body = models.BinaryField(help_text=_("Rendered menu document (JSON)"))
+    body_gzip = models.BinaryField(help_text=_("gzip-compressed body"))
+    body_br = models.BinaryField(blank=True, null=True, help_text=_("brotli-compressed body, when brotli is installed"))
+    etag = models.CharField(max_length=64, help_text=_("Hash of body"))
+    built_at = models.DateTimeField(auto_now=True, help_text=_("Time when the snapshot was last rebuilt"))
+
+    def __str__(self):
+        return f"Menu snapshot of restaurant {self.restaurant_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The outcome of a write sent with an Idempotency-Key header, replayed to
+    retries of the same request until it expires. status_code is empty while
+    the first request is still running.
+    """
+    scope = models.CharField(max_length=150, help_text=_("Endpoint (and caller) the key belongs to"))
+    key = models.CharField(max_length=255, help_text=_("Client-supplied Idempotency-Key"))
+    request_hash = models.CharField(max_length=64, help_text=_("Hash of the request the key was first used with"))
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_scope_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_purge_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
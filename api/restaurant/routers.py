@@ -0,0 +1,56 @@
+from django.conf import settings
+
+from .models import Restaurant
+from .sharding import SHARDED_MODELS, is_sharded, shard_for_restaurant
+
+
+class OrderShardRouter:
+    """
+    Routes orders and order items to the shard of their restaurant.
+
+    The shard is derived from the instance hint: a restaurant (for
+    ``restaurant.orders``), an order (for ``order.items`` and saves) or an
+    order item whose order is loaded. Archived orders follow the same rules.
+    Lookups without a usable hint fall through to the next router; use
+    ``Order.objects.for_restaurant()`` or ``Order.objects.for_user()`` for
+    those.
+    """
+
+    def _shard(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+
+        if isinstance(instance, Restaurant):
+            return shard_for_restaurant(instance.pk)
+        if is_sharded(type(instance)):
+            if instance._state.db:
+                return instance._state.db
+            restaurant_id = getattr(instance, 'restaurant_id', None)
+            if restaurant_id is not None:
+                return shard_for_restaurant(restaurant_id)
+            # Order items follow their (loaded) order.
+            order = instance._state.fields_cache.get('order')
+            return order._state.db if order is not None else None
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is not None and app_label == 'restaurant' and model_name in SHARDED_MODELS:
+            return db in settings.ORDER_SHARDS
+        if db != 'default' and db in settings.ORDER_SHARDS:
+            return False
+        return None
+
@@ -1,10 +1,135 @@
+import datetime
+import decimal
+
 from rest_framework import serializers
-from .models import Restaurant, Menu, MenuItem, Order, OrderItem, CartItem
+from rest_framework.settings import ISO_8601, api_settings
+from .models import Restaurant, Menu, MenuItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, CartItem, TeardownJob
 from django.utils.translation import gettext_lazy as _
 
 
 
-class RestaurantInfoSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Lets a caller keep only some fields: Serializer(obj, fields=['id', 'name']).
+    Views take the list from ?fields=a,b and also pass it to prune() so that
+    the query only reads the columns those fields need.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def field_sources(cls):
+        # Field name -> model attribute, built once per serializer class.
+        if '_field_sources' not in cls.__dict__:
+            cls._field_sources = {name: field.source for name, field in cls().fields.items()}
+        return cls._field_sources
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        The field names listed in ?fields=, or None when all are wanted.
+        """
+        value = request.query_params.get('fields')
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.field_sources()]
+        if unknown:
+            raise serializers.ValidationError({'fields': _("Unknown fields: %s") % ', '.join(unknown)})
+        return fields
+
+    @classmethod
+    def prune(cls, queryset, fields):
+        """
+        Restrict queryset to the columns needed to serialize fields.
+        """
+        if fields is None:
+            return queryset
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        sources = cls.field_sources()
+        columns = {sources[name] for name in fields if sources[name] in concrete}
+        # Foreign key ids are cheap and related managers set them on every
+        # row; deferring them would cost one query per row.
+        columns.update(field.name for field in queryset.model._meta.concrete_fields if field.is_relation)
+        return queryset.only(*columns)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for list endpoints: renders .values_list() rows into
+    the same output as serializer_class(..., many=True).data, without building
+    model instances or calling every field per row.
+
+    Field converters are chosen once. Decimal, datetime and time fields use
+    inlined versions of DRF's formatting; fields whose DB value is already the
+    output (ids, strings, integers, booleans) are copied; anything else falls
+    back to the field's own to_representation().
+    """
+    IDENTITY_FIELDS = (
+        serializers.CharField, serializers.URLField, serializers.EmailField,
+        serializers.IntegerField, serializers.BooleanField,
+    )
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class(fields=fields) if issubclass(serializer_class, SparseFieldsMixin) else serializer_class()
+        readable = [field for field in serializer.fields.values() if not field.write_only]
+        self.names = [field.field_name for field in readable]
+        self.columns = [field.source for field in readable]
+        self.converters = [self.converter(field) for field in readable]
+
+    @classmethod
+    def converter(cls, field):
+        """
+        A callable turning a non-null DB value into field's representation,
+        or None when the value can be used as is.
+        """
+        if type(field) in cls.IDENTITY_FIELDS:
+            return None
+        if type(field) is serializers.PrimaryKeyRelatedField and field.pk_field is None:
+            return None
+        if type(field) is serializers.DecimalField:
+            coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            if coerce_to_string and not field.localize and not field.normalize_output and field.decimal_places is not None:
+                exponent = decimal.Decimal('.1') ** field.decimal_places
+                context = decimal.getcontext().copy()
+                if field.max_digits is not None:
+                    context.prec = field.max_digits
+                rounding = field.rounding
+                return lambda value: '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+        if type(field) is serializers.DateTimeField:
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            field_timezone = getattr(field, 'timezone', None) or field.default_timezone()
+            if output_format and output_format.lower() == ISO_8601 and field_timezone is not None:
+                def datetime_converter(value):
+                    value = value.astimezone(field_timezone).isoformat()
+                    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+                return datetime_converter
+        if type(field) is serializers.TimeField:
+            output_format = getattr(field, 'format', api_settings.TIME_FORMAT)
+            if output_format and output_format.lower() == ISO_8601:
+                return datetime.time.isoformat
+        return field.to_representation
+
+    def serialize(self, queryset):
+        """
+        Output of the serializer for every row of queryset, as a list of dicts.
+        """
+        names = self.names
+        converters = [(index, convert) for index, convert in enumerate(self.converters) if convert is not None]
+        data = []
+        for row in queryset.values_list(*self.columns):
+            row = list(row)
+            for index, convert in converters:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+            data.append(dict(zip(names, row)))
+        return data
+
+
+class RestaurantInfoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Restaurant model.
     """
@@ -27,7 +152,7 @@ class RestaurantInfoSerializer(serializers.ModelSerializer):
         }
 
 
-class MenuSerializer(serializers.ModelSerializer):
+class MenuSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Menu model.
     """
@@ -40,49 +165,92 @@ class MenuSerializer(serializers.ModelSerializer):
             'category_name': {'required': True}
         }
         
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the MenuItem model.
     """
     class Meta:
         model = MenuItem
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['image_variants', 'created_at', 'updated_at']
         extra_kwargs = {
             'menu': {'required': True},
             'name': {'required': True},
             'price': {'required': True}
         }
 
-class OrderSerializer(serializers.ModelSerializer):
+class MenuItemPatchSerializer(serializers.Serializer):
+    """
+    One entry of a batch availability / price update.
+    """
+    item_id = serializers.IntegerField()
+    is_available = serializers.BooleanField(required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    def validate(self, attrs):
+        if 'is_available' not in attrs and 'price' not in attrs:
+            raise serializers.ValidationError(_("Provide is_available and/or price."))
+        return attrs
+
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Order model.
     """
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['version', 'processing_started_at', 'created_at', 'updated_at']
         extra_kwargs = {
             'restaurant': {'required': True},
             'user': {'required': True},
             'order_status': {'required': True}
         }
 
-class OrderItemSerializer(serializers.ModelSerializer):
+    def validate_order_status(self, value):
+        current = self.instance.order_status if self.instance else None
+        if current is None and value != 'Pending':
+            raise serializers.ValidationError(_("New orders must start as Pending."))
+        if current is not None and value != current and value not in Order.STATUS_TRANSITIONS[current]:
+            raise serializers.ValidationError(
+                _("Cannot change status from %(current)s to %(new)s.") % {'current': current, 'new': value}
+            )
+        return value
+
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the OrderItem model.
+    The order is supplied by the view on save; it is read-only here because
+    orders live on per-restaurant shards and cannot be looked up by id alone.
     """
     class Meta:
         model = OrderItem
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['order', 'created_at', 'updated_at']
         extra_kwargs = {
-            'order': {'required': True},
             'item': {'required': True},
             'quantity': {'required': True}
         }
 
-class CartItemSerializer(serializers.ModelSerializer):
+class ArchivedOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Read-only serializer for archived orders, in the same shape as OrderSerializer.
+    """
+    class Meta:
+        model = ArchivedOrder
+        exclude = ['archived_at']
+
+
+class ArchivedOrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Read-only serializer for archived order items, in the same shape as OrderItemSerializer.
+    """
+    class Meta:
+        model = ArchivedOrderItem
+        fields = '__all__'
+
+
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the CartItem model.
     """
@@ -95,3 +263,13 @@ class CartItemSerializer(serializers.ModelSerializer):
             'item': {'required': True},
             'quantity': {'required': True}
         }
+
+
+class TeardownJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the TeardownJob model (read-only progress report).
+    """
+    class Meta:
+        model = TeardownJob
+        fields = '__all__'
+        read_only_fields = [field.name for field in TeardownJob._meta.fields]
@@ -0,0 +1,155 @@
+"""
+Horizontal sharding of orders.
+
+Orders and their items live on one of the database aliases listed in
+settings.ORDER_SHARDS, chosen by the order's restaurant. With no shards
+configured the list is just ['default'] and everything behaves as before.
+
+Each shard would hand out its own auto-increment ids, so orders and order
+items take theirs from ShardIdSequence on the primary database instead. Ids
+are then unique across shards and an order keeps its id when it moves.
+Processes reserve ids in blocks of settings.ORDER_ID_BLOCK_SIZE, so ids
+increase per process but not globally.
+"""
+import heapq
+import threading
+from itertools import islice
+from operator import attrgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import F, Max
+
+from core.routers import PRIMARY_DB
+
+# model_name of every model routed by restaurant
+SHARDED_MODELS = frozenset({'order', 'orderitem', 'archivedorder', 'archivedorderitem'})
+
+# model_name of every model whose ids come from ShardIdSequence, with the
+# models that keep those ids (archived copies) and so count as taken.
+ID_SEQUENCES = {
+    'order': ('order', 'archivedorder'),
+    'orderitem': ('orderitem', 'archivedorderitem'),
+}
+
+_id_blocks = {}
+_id_blocks_lock = threading.Lock()
+
+
+def order_shards():
+    return settings.ORDER_SHARDS
+
+
+def order_databases():
+    """
+    Every database that may hold orders: the shards, plus 'default' while it
+    still has the order tables from before sharding.
+    """
+    aliases = list(order_shards())
+    if PRIMARY_DB not in aliases:
+        order_table = apps.get_model('restaurant', 'Order')._meta.db_table
+        if order_table in connections[PRIMARY_DB].introspection.table_names():
+            aliases.insert(0, PRIMARY_DB)
+    return aliases
+
+
+def shard_for_restaurant(restaurant_id):
+    """
+    Database alias holding the orders of the given restaurant.
+    """
+    shards = settings.ORDER_SHARDS
+    return shards[int(restaurant_id) % len(shards)]
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'restaurant' and model._meta.model_name in SHARDED_MODELS
+
+
+def SHARD_CASCADE(collector, field, sub_objs, using):
+    """
+    CASCADE for foreign keys that point from a sharded model to an unsharded
+    one: the dependent rows are deleted on every shard, not only on the
+    database the parent is being deleted from.
+    """
+    for alias in order_shards():
+        sub_objs.using(alias).delete()
+
+
+SHARD_CASCADE.lazy_sub_objs = True
+
+
+def merge_by(querysets, key, reverse=False, limit=None):
+    """
+    Merge querysets from several shards, each already ordered by `key` (an
+    attribute name or a tuple of them). Returns at most `limit` objects.
+    """
+    key = attrgetter(*key) if isinstance(key, tuple) else attrgetter(key)
+    return list(islice(heapq.merge(*querysets, key=key, reverse=reverse), limit))
+
+
+def copy_rows(model, objs, using):
+    """
+    Insert objs into `using` as-is, keeping primary keys and the
+    auto_now/auto_now_add timestamps that a normal save would overwrite.
+    """
+    if not objs:
+        return
+    fields = model._meta.concrete_fields
+    model._base_manager.using(using)._insert(objs, fields=fields, using=using, raw=True)
+
+
+def reset_sequences(models, using):
+    """
+    Move the primary key sequences past rows inserted with explicit ids.
+    """
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def _highest_id(name):
+    highest = 0
+    for alias in order_databases():
+        for model_name in ID_SEQUENCES[name]:
+            model = apps.get_model('restaurant', model_name)
+            highest = max(highest, model._base_manager.using(alias).aggregate(highest=Max('pk'))['highest'] or 0)
+    return highest
+
+
+def reserve_ids(model, count):
+    """
+    Reserve `count` ids for a sharded model. Returns them as a range. The
+    sequence starts above every id already in use, so ids handed out before
+    it existed are never reused.
+
+    The reservation commits on its own (a durable block), because ids taken
+    inside a transaction that later rolls back would be handed out again.
+    """
+    name = model._meta.model_name
+    ShardIdSequence = apps.get_model('restaurant', 'ShardIdSequence')
+    sequences = ShardIdSequence.objects.using(PRIMARY_DB)
+    with transaction.atomic(using=PRIMARY_DB, durable=True):
+        if not sequences.filter(name=name).update(next_id=F('next_id') + count):
+            sequences.get_or_create(name=name, defaults={'next_id': _highest_id(name) + 1})
+            sequences.filter(name=name).update(next_id=F('next_id') + count)
+        end = sequences.filter(name=name).values_list('next_id', flat=True).get()
+    return range(end - count, end)
+
+
+def next_id(model):
+    """
+    A new id for a sharded model that is unique across every shard.
+    """
+    name = model._meta.model_name
+    with _id_blocks_lock:
+        block = _id_blocks.get(name)
+        value = next(block, None) if block is not None else None
+        if value is None:
+            block = _id_blocks[name] = iter(reserve_ids(model, settings.ORDER_ID_BLOCK_SIZE))
+            value = next(block)
+    return value
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Menu, MenuItem, MenuTombstone, Order
+from .snapshots import schedule_snapshot_rebuild
+
+# Sent once per change set that is written without model signals (batch
+# update, bulk import, background updates) after the transaction commits, so
+# caches and push channels are notified only once. Single saves and deletes
+# are picked up by the post_save/post_delete receivers below instead.
+# Arguments: restaurant_id, item_ids (None when the whole menu may have changed).
+menu_changed = Signal()
+
+
+def notify_menu_changed(restaurant_id, item_ids=None):
+    transaction.on_commit(
+        lambda: menu_changed.send(sender=MenuItem, restaurant_id=restaurant_id, item_ids=item_ids)
+    )
+
+
+# Sent after an order's status change is committed on its shard.
+# Arguments: order (with the new status and version), old_status.
+order_status_changed = Signal()
+
+
+def notify_order_status_changed(order, old_status):
+    transaction.on_commit(
+        lambda: order_status_changed.send(sender=Order, order=order, old_status=old_status),
+        using=order._state.db,
+    )
+
+
+def _deleted_directly(origin, model):
+    """
+    True unless the row is going away as part of a cascade from a parent,
+    whose own tombstone (or disappearance) already covers it.
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+@receiver(post_delete, sender=Menu)
+def record_menu_tombstone(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, Menu):
+        MenuTombstone.objects.create(
+            kind=MenuTombstone.Kind.MENU,
+            object_id=instance.pk,
+            restaurant_id=instance.restaurant_id,
+        )
+
+
+@receiver(post_delete, sender=MenuItem)
+def record_menu_item_tombstone(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, MenuItem):
+        MenuTombstone.objects.create(
+            kind=MenuTombstone.Kind.MENU_ITEM,
+            object_id=instance.pk,
+            restaurant_id=instance.menu.restaurant_id,
+        )
+
+
+@receiver(menu_changed)
+def rebuild_snapshot_on_menu_changed(sender, restaurant_id, **kwargs):
+    schedule_snapshot_rebuild(restaurant_id)
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+def rebuild_snapshot_on_menu_save(sender, instance, origin=None, **kwargs):
+    if 'created' in kwargs or _deleted_directly(origin, Menu):
+        schedule_snapshot_rebuild(instance.restaurant_id)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def rebuild_snapshot_on_menu_item_save(sender, instance, origin=None, **kwargs):
+    if 'created' in kwargs or _deleted_directly(origin, MenuItem):
+        schedule_snapshot_rebuild(instance.menu.restaurant_id)
@@ -0,0 +1,131 @@
+"""
+Prebuilt menu documents.
+
+Each restaurant's menu (its menus with their items) is rendered to JSON once
+and stored in MenuSnapshot together with gzip and, when the brotli package is
+installed, brotli variants. Menu changes queue a rebuild on the background
+pool; several changes arriving before the rebuild starts are coalesced into
+one. Readers get the stored bytes for the encoding they accept.
+
+Rebuilds of one restaurant run one at a time, across threads and processes:
+each locks the restaurant row and renders only once it holds the lock. A
+rebuild that started earlier can therefore never overwrite the output of a
+later one.
+
+Stock counts are left out: they change with every order line, and rebuilding
+on each one would cost more than the snapshot saves. The item list and the
+delta sync serve live counts; an item selling out or coming back changes
+is_available and does rebuild the snapshot.
+"""
+import gzip
+import hashlib
+import threading
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from core.renderers import ORJSONRenderer
+from core.routers import PRIMARY_DB, use_primary
+
+from .models import MenuItem, MenuSnapshot, Restaurant
+from .serializers import MenuItemSerializer, MenuSerializer
+from .tasks import run_in_background
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def render_menu(restaurant):
+    """
+    The menu document of restaurant as JSON bytes.
+    """
+    menus = restaurant.menus.order_by('category_name', 'id').prefetch_related(
+        Prefetch('menu_items', queryset=MenuItem.objects.order_by('name', 'id')),
+    )
+    item_fields = [name for name in MenuItemSerializer().fields if name != 'stock']
+    document = {
+        'restaurant': restaurant.pk,
+        'menus': [
+            {
+                **MenuSerializer(menu).data,
+                'menu_items': MenuItemSerializer(menu.menu_items.all(), many=True, fields=item_fields).data,
+            }
+            for menu in menus
+        ],
+    }
+    return ORJSONRenderer().render(document)
+
+
+def build_snapshot(restaurant_id):
+    """
+    Render and store the snapshot of one restaurant. Returns it, or None if
+    the restaurant no longer exists.
+    """
+    with use_primary(), transaction.atomic(using=PRIMARY_DB):
+        # Held until the snapshot is stored; a rebuild queued by a change
+        # made meanwhile waits here and renders after this one.
+        restaurant = Restaurant.objects.using(PRIMARY_DB).select_for_update().filter(pk=restaurant_id).first()
+        if restaurant is None:
+            return None
+
+        body = render_menu(restaurant)
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        snapshot = MenuSnapshot.objects.filter(restaurant=restaurant).only('etag').first()
+        if snapshot is not None and snapshot.etag == etag:
+            return snapshot
+
+        snapshot, _ = MenuSnapshot.objects.update_or_create(
+            restaurant=restaurant,
+            defaults={
+                'body': body,
+                'body_gzip': gzip.compress(body, compresslevel=9),
+                'body_br': brotli.compress(body, quality=11) if brotli else None,
+                'etag': etag,
+            },
+        )
+    return snapshot
+
+
+def _rebuild(restaurant_id):
+    with _pending_lock:
+        # Changes made from here on queue a new rebuild.
+        _pending.discard(restaurant_id)
+    build_snapshot(restaurant_id)
+
+
+def _queue(restaurant_id):
+    with _pending_lock:
+        if restaurant_id in _pending:
+            return
+        _pending.add(restaurant_id)
+    run_in_background(_rebuild, restaurant_id)
+
+
+def schedule_snapshot_rebuild(restaurant_id):
+    """
+    Rebuild the snapshot in the background once the current transaction
+    commits, unless a rebuild for the restaurant is already waiting.
+    """
+    transaction.on_commit(lambda: _queue(restaurant_id))
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Content codings listed in an Accept-Encoding header, minus those with q=0.
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        quality = params.strip().lower().removeprefix('q=')
+        try:
+            if coding and (not params or float(quality) > 0):
+                accepted.add(coding)
+        except ValueError:
+            continue
+    return accepted
@@ -0,0 +1,83 @@
+"""
+In-process background execution for work that should not run on the request.
+
+Tasks are handed to a small thread pool once the surrounding transaction
+commits. Every task closes its own database connections when done. Jobs that
+must survive a restart keep their state in the database and have a
+management command to resume them.
+
+Slow work runs on pools of its own (POOLS), each with a capped number of
+threads, so that image fetching or a user import cannot hold up the menu
+snapshots and teardowns on the shared pool.
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Pool name -> setting holding its number of threads.
+POOLS = {
+    'default': 'BACKGROUND_WORKERS',
+    'images': 'IMAGE_WORKERS',
+    'imports': 'IMPORT_WORKERS',
+}
+
+_executors = {}
+_pending = Counter()
+_lock = threading.Lock()
+
+
+def _get_executor(pool='default'):
+    with _lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=getattr(settings, POOLS[pool]),
+                thread_name_prefix=f'{pool}-tasks',
+            )
+        return _executors[pool]
+
+
+def _run(pool, func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+    finally:
+        connections.close_all()
+        with _lock:
+            _pending[pool] -= 1
+
+
+def _submit(pool, func, args, kwargs):
+    with _lock:
+        _pending[pool] += 1
+    _get_executor(pool).submit(_run, pool, func, args, kwargs)
+
+
+def pending_tasks(pool):
+    """
+    Tasks of the pool that are queued or running in this process.
+    """
+    with _lock:
+        return _pending[pool]
+
+
+def run_in_pool(pool, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the named pool after the current transaction
+    commits (immediately if there is none).
+    """
+    transaction.on_commit(lambda: _submit(pool, func, args, kwargs))
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the shared background pool after the current
+    transaction commits (immediately if there is none).
+    """
+    run_in_pool('default', func, *args, **kwargs)
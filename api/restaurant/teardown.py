@@ -0,0 +1,159 @@
+"""
+Chunked, resumable deletion of a restaurant.
+
+Deleting a restaurant through the ORM makes Django collect every menu, menu
+item, order, order item and cart row in memory before issuing the deletes.
+Instead, a TeardownJob walks the tables children-first and removes rows in
+fixed-size batches of raw DELETEs, each in its own short transaction. Every
+step only deletes what is left, so a failed or interrupted job can be run
+again from the start.
+
+While a job is unfinished, the API refuses writes for its restaurant
+(is_being_torn_down). A write that slipped in just before the job started
+is caught by sweeping the child tables again until they are empty; only
+then are the restaurant and store rows deleted.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.routers import PRIMARY_DB, use_primary
+
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, CartItem, Menu, MenuItem, MenuSnapshot, MenuTombstone, Order, OrderItem,
+    Restaurant, Store, TeardownJob,
+)
+from .sharding import order_shards
+from .tasks import run_in_background
+
+# Steps deleting the rows everything else hangs off; they run last.
+PARENT_STEPS = ('restaurants', 'stores')
+
+
+def start_teardown(restaurant, delete_store=False):
+    """
+    Hide the restaurant and queue its deletion. Returns the TeardownJob
+    (the already running one if the restaurant is being torn down).
+    """
+    with transaction.atomic(using=PRIMARY_DB):
+        # Concurrent requests queue on the restaurant row, so the second one
+        # sees the job the first one created.
+        Restaurant.objects.using(PRIMARY_DB).select_for_update().filter(pk=restaurant.pk).exists()
+        active = TeardownJob.objects.using(PRIMARY_DB).filter(
+            restaurant_id=restaurant.pk,
+            status__in=[TeardownJob.Status.PENDING, TeardownJob.Status.RUNNING],
+        ).first()
+        if active:
+            return active
+
+        Restaurant.objects.filter(pk=restaurant.pk).update(is_active=False)
+        job = TeardownJob.objects.create(
+            restaurant_id=restaurant.pk,
+            store_id=restaurant.store_id,
+            delete_store=delete_store,
+        )
+        run_in_background(run_teardown, job.pk)
+    return job
+
+
+def is_being_torn_down(restaurant_id):
+    """
+    Whether a teardown of the restaurant has started and not finished. Writes
+    for such a restaurant are refused, so nothing is added behind the job.
+    """
+    return TeardownJob.objects.using(PRIMARY_DB).filter(restaurant_id=restaurant_id).exclude(
+        status=TeardownJob.Status.DONE,
+    ).exists()
+
+
+def teardown_steps(job):
+    """
+    (label, alias, queryset) for every table to empty, children before parents.
+    """
+    restaurant_id = job.restaurant_id
+    steps = [
+        ('cart_items', PRIMARY_DB, CartItem.objects.using(PRIMARY_DB).filter(item__menu__restaurant_id=restaurant_id)),
+    ]
+    if job.delete_store:
+        steps.append(('cart_items', PRIMARY_DB, CartItem.objects.using(PRIMARY_DB).filter(store_id=job.store_id)))
+
+    for alias in order_shards():
+        steps += [
+            ('order_items', alias, OrderItem.objects.using(alias).filter(order__restaurant_id=restaurant_id)),
+            ('orders', alias, Order.objects.using(alias).filter(restaurant_id=restaurant_id)),
+            ('archived_order_items', alias, ArchivedOrderItem.objects.using(alias).filter(order__restaurant_id=restaurant_id)),
+            ('archived_orders', alias, ArchivedOrder.objects.using(alias).filter(restaurant_id=restaurant_id)),
+        ]
+
+    steps += [
+        ('menu_items', PRIMARY_DB, MenuItem.objects.using(PRIMARY_DB).filter(menu__restaurant_id=restaurant_id)),
+        ('menus', PRIMARY_DB, Menu.objects.using(PRIMARY_DB).filter(restaurant_id=restaurant_id)),
+        ('menu_tombstones', PRIMARY_DB, MenuTombstone.objects.using(PRIMARY_DB).filter(restaurant_id=restaurant_id)),
+        ('menu_snapshots', PRIMARY_DB, MenuSnapshot.objects.using(PRIMARY_DB).filter(restaurant_id=restaurant_id)),
+        ('restaurants', PRIMARY_DB, Restaurant.objects.using(PRIMARY_DB).filter(pk=restaurant_id)),
+    ]
+    if job.delete_store:
+        steps.append(('stores', PRIMARY_DB, Store.objects.using(PRIMARY_DB).filter(pk=job.store_id)))
+    return steps
+
+
+def delete_in_batches(queryset, alias, batch_size):
+    """
+    Delete the rows matched by queryset, batch_size primary keys at a time,
+    without loading model instances. Yields the size of each batch.
+    """
+    model = queryset.model
+    while True:
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        with transaction.atomic(using=alias):
+            model._base_manager.using(alias).filter(pk__in=pks)._raw_delete(alias)
+        yield len(pks)
+
+
+def _run_steps(job, steps, batch_size):
+    """
+    Run steps once, recording progress on job. Returns the rows deleted.
+    """
+    deleted = 0
+    for label, alias, queryset in steps:
+        for count in delete_in_batches(queryset, alias, batch_size):
+            job.deleted[label] = job.deleted.get(label, 0) + count
+            job.save(update_fields=['deleted', 'updated_at'])
+            deleted += count
+    return deleted
+
+
+def run_teardown(job_id, batch_size=None):
+    # Background work has no request to pin it; job state must come from the primary.
+    with use_primary():
+        job = TeardownJob.objects.get(pk=job_id)
+        if job.status == TeardownJob.Status.DONE:
+            return job
+        batch_size = batch_size or settings.TEARDOWN_BATCH_SIZE
+
+        job.status = TeardownJob.Status.RUNNING
+        job.error = ''
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        steps = teardown_steps(job)
+        children = [step for step in steps if step[0] not in PARENT_STEPS]
+        parents = [step for step in steps if step[0] in PARENT_STEPS]
+        try:
+            # A write that passed the teardown check just before the job was
+            # created can land behind an earlier step; repeat the children
+            # until a pass finds nothing, since the shards have no foreign
+            # keys to stop the parent delete.
+            while _run_steps(job, children, batch_size):
+                pass
+            _run_steps(job, parents, batch_size)
+        except Exception as exc:
+            job.status = TeardownJob.Status.FAILED
+            job.error = str(exc)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+
+        job.status = TeardownJob.Status.DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return job
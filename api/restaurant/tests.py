@@ -1,3 +1,532 @@
-from django.test import TestCase
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.renderers import ORJSONRenderer
+
+from . import snapshots
+from .inventory import release_stock, reserve_stock
+from .menu_images import _refresh_menu_images, build_menu_item_variants
+from .models import ArchivedOrder, CartItem, Menu, MenuItem, MenuSnapshot, Order, OrderItem, Restaurant, Store
+from .serializers import CartItemSerializer, MenuItemSerializer
+from .sharding import reserve_ids
+from .teardown import delete_in_batches, run_teardown, start_teardown
+from .signals import menu_changed, notify_menu_changed, order_status_changed
+
+User = get_user_model()
+
+
+def make_restaurant(owner, name='Test kitchen'):
+    store = Store.objects.create(owner=owner, name=name)
+    return Restaurant.objects.create(
+        store=store, name=name, address='1 Main St', city='Pune', state='MH', pincode='411001',
+        opening_time='00:00', closing_time='23:59',
+    )
+
+
+def run_concurrently(threads, work):
+    """
+    work(index) on `threads` threads released at the same moment.
+    """
+    barrier = threading.Barrier(threads)
+
+    def run(index):
+        barrier.wait()
+        try:
+            return work(index)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(run, range(threads)))
+
+
+class ValuesSerializerTests(TestCase):
+    """
+    The list endpoints render through ValuesSerializer; their output must be
+    byte-identical to the ModelSerializer output.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='customer')
+        cls.restaurant = make_restaurant(User.objects.create(username='owner'))
+        cls.menu = Menu.objects.create(restaurant=cls.restaurant, category_name='Mains')
+        variants = {
+            'source': 'https://img.example.com/dal.jpg',
+            'variants': {'thumb': {'webp': '/media/menu_items/variants/a.webp', 'jpg': '/media/menu_items/variants/a.jpg'}},
+        }
+        items = [
+            MenuItem(menu=cls.menu, name='Dal', description='Yellow lentils', price=Decimal('120.5'),
+                     image_url=variants['source'], image_variants=variants, stock=3),
+            MenuItem(menu=cls.menu, name='Rice', price=Decimal('40'), is_available=False, is_vegetarian=True),
+            MenuItem(menu=cls.menu, name='Chicken “65”', description='', price=Decimal('0.99'), is_vegetarian=False),
+        ]
+        for item in items:
+            item.save()
+            CartItem.objects.create(user=cls.user, store=cls.restaurant.store, item=item, quantity=2)
+
+    def setUp(self):
+        cache.clear()  # throttle counters
+
+    def expected(self, serializer_class, queryset, fields=None):
+        return ORJSONRenderer().render(serializer_class(queryset, many=True, fields=fields).data)
+
+    def test_menu_items_match_model_serializer(self):
+        response = self.client.get('/api/restaurant/menu/item/', {'store_id': self.restaurant.store_id, 'menu_id': self.menu.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.expected(MenuItemSerializer, self.menu.menu_items.all()))
+        self.assertIn(b'"image_variants":{"source":', response.content)
+
+    def test_menu_items_with_fields(self):
+        fields = ['id', 'name', 'price', 'image_variants', 'updated_at']
+        response = self.client.get('/api/restaurant/menu/item/', {
+            'store_id': self.restaurant.store_id, 'menu_id': self.menu.pk, 'fields': ','.join(fields),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.expected(MenuItemSerializer, self.menu.menu_items.all(), fields))
+        self.assertEqual(list(response.json()[0]), fields)
+
+    def test_cart_items_match_model_serializer(self):
+        response = self.client.get('/api/restaurant/cart/', {'user_id': self.user.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.expected(CartItemSerializer, CartItem.objects.filter(user=self.user)))
+
+    def test_cart_items_with_fields(self):
+        fields = ['id', 'item', 'quantity']
+        response = self.client.get('/api/restaurant/cart/', {'user_id': self.user.pk, 'fields': ','.join(fields)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content, self.expected(CartItemSerializer, CartItem.objects.filter(user=self.user), fields),
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/restaurant/cart/', {'user_id': self.user.pk, 'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='customer')
+        cls.restaurant = make_restaurant(User.objects.create(username='owner'))
+
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(restaurant=self.restaurant, user=self.user, total_amount='10.00')
+        self.signals = []
+        order_status_changed.connect(self.record_signal)
+        self.addCleanup(order_status_changed.disconnect, self.record_signal)
+
+    def record_signal(self, sender, order, old_status, **kwargs):
+        self.signals.append((old_status, order.order_status))
+
+    def put(self, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put('/api/restaurant/order/', {
+                'store_id': self.restaurant.store_id, 'order_id': self.order.pk, 'user_id': self.user.pk, **changes,
+            }, content_type='application/json')
+
+    def test_update_bumps_version(self):
+        response = self.put(order_status='Processing', version=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 1)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.version), ('Processing', 1))
+        self.assertIsNotNone(self.order.processing_started_at)
+
+    def test_stale_version_is_rejected(self):
+        self.assertEqual(self.put(delivery_address='Gate 2', version=0).status_code, 200)
+        response = self.put(order_status='Cancelled', version=0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['current']['version'], 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 'Pending')
+        self.assertEqual(self.signals, [])
+
+    def test_update_if_current_loses_to_a_concurrent_change(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(Order.objects.update_if_current(self.order, order_status='Processing'))
+        self.assertFalse(Order.objects.update_if_current(stale, order_status='Cancelled'))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.version), ('Processing', 1))
+
+    def test_illegal_transition_is_rejected(self):
+        self.assertEqual(self.put(order_status='Cancelled').status_code, 200)
+        response = self.put(order_status='Processing')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('order_status', response.json())
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.order_status, self.order.version), ('Cancelled', 1))
+
+    def test_status_changed_signal_fires_once_per_change(self):
+        self.put(order_status='Processing')
+        self.put(delivery_address='Gate 2')
+        self.put(order_status='Processing')
+        self.put(order_status='Delivered')
+        self.assertEqual(self.signals, [('Pending', 'Processing'), ('Processing', 'Delivered')])
+
+
+class OrderIdTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='customer')
+        cls.restaurant = make_restaurant(User.objects.create(username='owner'))
+        now = timezone.now()
+        # An order archived before the sequence existed keeps its id taken.
+        ArchivedOrder.objects.create(
+            id=500, restaurant=cls.restaurant, user=cls.user, order_date=now, order_status='Delivered',
+            total_amount='10.00', created_at=now, updated_at=now,
+        )
+
+    def setUp(self):
+        patcher = mock.patch('api.restaurant.sharding._id_blocks', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sequence_starts_above_ids_in_use(self):
+        self.assertEqual(reserve_ids(Order, 3), range(501, 504))
+        self.assertEqual(reserve_ids(Order, 3), range(504, 507))
+        self.assertEqual(reserve_ids(OrderItem, 2), range(1, 3))
+
+    @override_settings(ORDER_ID_BLOCK_SIZE=2)
+    def test_new_rows_take_ids_from_the_sequence(self):
+        orders = [
+            Order.objects.create(restaurant=self.restaurant, user=self.user, total_amount='10.00'),
+            *Order.objects.bulk_create(
+                Order(restaurant=self.restaurant, user=self.user, total_amount='10.00') for _ in range(2)
+            ),
+        ]
+        self.assertEqual([order.pk for order in orders], [501, 502, 503])
+        menu = Menu.objects.create(restaurant=self.restaurant, category_name='Mains')
+        item = MenuItem.objects.create(menu=menu, name='Dal', price='5.00')
+        line = OrderItem.objects.create(order=orders[0], item=item, quantity=1, price='5.00')
+        self.assertEqual(line.pk, 1)
+        self.assertEqual(Order.objects.filter(pk__in=[501, 502, 503]).count(), 3)
+
+
+class OrderHistoryTests(TestCase):
+
+    def test_pages_through_live_and_archived_orders(self):
+        user = User.objects.create(username='customer')
+        restaurant = make_restaurant(User.objects.create(username='owner'))
+        now = timezone.now()
+        for days in (1, 3):
+            ArchivedOrder.objects.create(
+                id=1000 + days, restaurant=restaurant, user=user, order_date=now, order_status='Delivered',
+                total_amount='10.00', created_at=now - timedelta(days=days), updated_at=now,
+            )
+        for _ in range(4):
+            Order.objects.create(restaurant=restaurant, user=user, total_amount='10.00')
+        # Two orders placed at the same moment are told apart by id.
+        Order.objects.filter(pk__in=Order.objects.order_by('id').values('id')[:2]).update(created_at=now)
+
+        pages, before = [], None
+        while page := Order.objects.for_user(user.pk, limit=4, before=before):
+            pages.append(page)
+            before = (page[-1].created_at, page[-1].pk)
+
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        history = [order for page in pages for order in page]
+        self.assertEqual(len({order.pk for order in history}), 6)
+        self.assertEqual([order.pk for order in history[-2:]], [1001, 1003])
+        keys = [(order.created_at, order.pk) for order in history]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(len(Order.objects.for_user(user.pk, archived=False)), 4)
+
+
+class OrderRaceTests(TransactionTestCase):
+
+    def test_only_one_racing_transition_wins(self):
+        user = User.objects.create(username='customer')
+        order = Order.objects.create(restaurant=make_restaurant(user), user=user, total_amount='10.00')
+        targets = ['Processing', 'Cancelled']
+
+        # Every client acts on the Pending version it was shown.
+        wins = run_concurrently(8, lambda index: Order.objects.update_if_current(order, order_status=targets[index % 2]))
+
+        self.assertEqual(sum(wins), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.version, 1)
+
+    def test_no_update_is_lost(self):
+        user = User.objects.create(username='customer')
+        order = Order.objects.create(restaurant=make_restaurant(user), user=user, total_amount='10.00')
+
+        def work(index):
+            won = []
+            for attempt in range(10):
+                current = Order.objects.get(pk=order.pk)
+                if Order.objects.update_if_current(current, delivery_address=f'{index}-{attempt}'):
+                    won.append(current.version)
+            return won
+
+        won = [version for versions in run_concurrently(8, work) for version in versions]
+        order.refresh_from_db()
+        # Every successful update started from a different version.
+        self.assertEqual(sorted(won), list(range(len(won))))
+        self.assertEqual(order.version, len(won))
+
+    def test_concurrent_id_reservations_do_not_overlap(self):
+        blocks = run_concurrently(8, lambda index: [reserve_ids(Order, 3) for _ in range(5)])
+        ids = [value for worker in blocks for block in worker for value in block]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), list(range(1, 8 * 5 * 3 + 1)))
+
+
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='customer')
+        cls.restaurant = make_restaurant(User.objects.create(username='owner'))
+        cls.menu = Menu.objects.create(restaurant=cls.restaurant, category_name='Specials')
+
+    def setUp(self):
+        cache.clear()
+        self.item = MenuItem.objects.create(menu=self.menu, name='Biryani', price='250.00', stock=5)
+        self.order = Order.objects.create(restaurant=self.restaurant, user=self.user, total_amount='0.00')
+        self.menu_changes = []
+        menu_changed.connect(self.record_menu_change)
+        self.addCleanup(menu_changed.disconnect, self.record_menu_change)
+
+    def record_menu_change(self, sender, item_ids, **kwargs):
+        self.menu_changes.append(item_ids)
+
+    def request(self, method, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(
+                '/api/restaurant/order/item/',
+                {'store_id': self.restaurant.store_id, 'order_id': self.order.pk, **data},
+                content_type='application/json',
+            )
+
+    def add_line(self, quantity):
+        return self.request('post', item_id=self.item.pk, quantity=quantity, price='250.00')
+
+    def assertStock(self, stock, is_available):
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.is_available), (stock, is_available))
+
+    def test_adding_a_line_reserves_stock(self):
+        self.assertEqual(self.add_line(2).status_code, 201)
+        self.assertStock(3, True)
+        # Count changes are not menu changes.
+        self.assertEqual(self.menu_changes, [])
+
+    def test_last_units_sell_out(self):
+        self.assertEqual(self.add_line(5).status_code, 201)
+        self.assertStock(0, False)
+        self.assertEqual(self.menu_changes, [[self.item.pk]])
+
+        response = self.add_line(1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['stock'], 0)
+
+    def test_quantity_changes_reserve_and_release_the_difference(self):
+        line = self.add_line(2).json()
+        self.assertEqual(self.request('put', item_id=line['id'], quantity=4).status_code, 200)
+        self.assertStock(1, True)
+        self.assertEqual(self.request('put', item_id=line['id'], quantity=9).status_code, 409)
+        self.assertStock(1, True)
+        self.assertEqual(self.request('put', item_id=line['id'], quantity=1).status_code, 200)
+        self.assertStock(4, True)
+        self.assertEqual(self.request('delete', item_id=line['id']).status_code, 204)
+        self.assertStock(5, True)
+
+    def test_cancelling_the_order_releases_stock(self):
+        self.add_line(5)
+        self.assertStock(0, False)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/restaurant/order/', {
+                'store_id': self.restaurant.store_id, 'order_id': self.order.pk, 'user_id': self.user.pk,
+                'order_status': 'Cancelled',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertStock(5, True)
+        self.assertEqual(self.menu_changes, [[self.item.pk], [self.item.pk]])
+
+    def test_finished_orders_take_no_stock(self):
+        Order.objects.filter(pk=self.order.pk).update(order_status='Delivered')
+        self.assertEqual(self.add_line(1).status_code, 400)
+        self.assertStock(5, True)
+        self.assertFalse(OrderItem.objects.filter(order_id=self.order.pk).exists())
+
+    def test_untracked_items_are_not_written(self):
+        self.item.stock = None
+        self.item.save()
+        self.assertEqual(self.add_line(50).status_code, 201)
+        self.assertStock(None, True)
+
+
+class TeardownTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='customer')
+        cls.restaurant = make_restaurant(User.objects.create(username='owner'))
+        cls.menu = Menu.objects.create(restaurant=cls.restaurant, category_name='Mains')
+        cls.item = MenuItem.objects.create(menu=cls.menu, name='Dal', price='5.00')
+
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(restaurant=self.restaurant, user=self.user, total_amount='10.00')
+
+    def post(self, path, **data):
+        return self.client.post(
+            f'/api/restaurant/{path}', {'store_id': self.restaurant.store_id, **data}, content_type='application/json',
+        )
+
+    def test_writes_are_refused_once_teardown_has_started(self):
+        # Not run: the background job only starts when the test transaction commits.
+        start_teardown(self.restaurant)
+        responses = {
+            'restaurant': self.client.put(
+                '/api/restaurant/info/', {'store': self.restaurant.store_id, 'is_active': True},
+                content_type='application/json',
+            ),
+            'menu': self.post('menu/', restaurant=self.restaurant.pk, category_name='Desserts'),
+            'menu item': self.post('menu/item/', menu_id=self.menu.pk, name='Kheer', price='3.00'),
+            'order': self.post('order/', user_id=self.user.pk, total_amount='10.00', order_status='Pending'),
+            'order item': self.post('order/item/', order_id=self.order.pk, item_id=self.item.pk, quantity=1, price='5.00'),
+            'cart item': self.post('cart/', user_id=self.user.pk, item_id=self.item.pk, quantity=1),
+        }
+        self.assertEqual({name: response.status_code for name, response in responses.items()}, dict.fromkeys(responses, 409))
+        self.assertEqual(Order.objects.for_restaurant(self.restaurant.pk).count(), 1)
+        self.restaurant.refresh_from_db()
+        self.assertFalse(self.restaurant.is_active)
+
+    def test_rows_written_during_the_teardown_are_swept_up(self):
+        job = start_teardown(self.restaurant)
+        late_orders = []
+
+        def late_write(queryset, alias, batch_size):
+            # An order slips in after the orders step has run.
+            if queryset.model is MenuItem and not late_orders:
+                late_orders.append(Order.objects.create(restaurant=self.restaurant, user=self.user, total_amount='1.00'))
+            return delete_in_batches(queryset, alias, batch_size)
+
+        with mock.patch('api.restaurant.teardown.delete_in_batches', side_effect=late_write):
+            job = run_teardown(job.pk)
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.deleted['orders'], 2)
+        self.assertFalse(Order.objects.for_restaurant(self.restaurant.pk).exists())
+        self.assertFalse(Restaurant.objects.filter(pk=self.restaurant.pk).exists())
+
+
+class BackgroundPoolTests(TestCase):
+
+    def test_image_work_stays_off_the_shared_pool(self):
+        restaurant = make_restaurant(User.objects.create(username='owner'))
+        menu = Menu.objects.create(restaurant=restaurant, category_name='Mains')
+        executors = {}
+
+        def get_executor(pool='default'):
+            return executors.setdefault(pool, mock.Mock())
+
+        # The mock pools never run their tasks, so they count as pending.
+        with mock.patch('api.restaurant.tasks._get_executor', side_effect=get_executor), \
+                mock.patch('api.restaurant.tasks._pending', Counter()):
+            with self.captureOnCommitCallbacks(execute=True):
+                item = MenuItem.objects.create(menu=menu, name='Dal', price='5.00', image_url='https://images.example.com/dal.png')
+                notify_menu_changed(restaurant.pk, [item.pk])
+
+        def submitted(pool):
+            # submit(_run, pool, func, args, kwargs)
+            return [call.args[2] for call in executors[pool].submit.call_args_list]
+
+        self.assertEqual(submitted('images'), [build_menu_item_variants, _refresh_menu_images])
+        self.assertEqual(submitted('default'), [snapshots._rebuild])
+
+
+class InlineExecutor:
+    def submit(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+
+class StockRaceTests(TransactionTestCase):
+
+    def setUp(self):
+        # Background menu work runs inline, so none of it outlives the test.
+        patcher = mock.patch('api.restaurant.tasks._get_executor', return_value=InlineExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        owner = User.objects.create(username='owner')
+        menu = Menu.objects.create(restaurant=make_restaurant(owner), category_name='Flash sale')
+        item = MenuItem.objects.create(menu=menu, name='Limited box', price='99.00', stock=30)
+        item = MenuItem.objects.select_related('menu').get(pk=item.pk)
+        quantities = [index % 3 + 1 for index in range(24)]  # 48 units wanted
+
+        reserved = run_concurrently(len(quantities), lambda index: reserve_stock(item, quantities[index]))
+
+        sold = sum(quantity for quantity, ok in zip(quantities, reserved) if ok)
+        item.refresh_from_db()
+        self.assertEqual(sold, 30 - item.stock)
+        self.assertGreaterEqual(item.stock, 0)
+        self.assertLess(item.stock, 3)
+        self.assertEqual(item.is_available, item.stock > 0)
+
+        release_stock(menu.restaurant_id, {item.pk: sold})
+        item.refresh_from_db()
+        self.assertEqual((item.stock, item.is_available), (30, True))
+
+
+class SnapshotRebuildTests(TransactionTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('api.restaurant.tasks._get_executor', return_value=InlineExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_an_earlier_rebuild_never_overwrites_a_later_one(self):
+        restaurant = make_restaurant(User.objects.create(username='owner'))
+        menu = Menu.objects.create(restaurant=restaurant, category_name='Mains')
+        item = MenuItem.objects.create(menu=menu, name='Old name', price='5.00')
+        events = []
+        rendering = threading.Event()
+        render_menu = snapshots.render_menu
+
+        def slow_render(restaurant):
+            name = threading.current_thread().name
+            events.append(('start', name))
+            if not rendering.is_set():
+                rendering.set()
+                time.sleep(0.3)
+            body = render_menu(restaurant)
+            events.append(('end', name))
+            return body
+
+        def rebuild():
+            try:
+                snapshots.build_snapshot(restaurant.pk)
+            finally:
+                connections.close_all()
+
+        with mock.patch('api.restaurant.snapshots.render_menu', side_effect=slow_render):
+            earlier = threading.Thread(target=rebuild, name='earlier')
+            earlier.start()
+            rendering.wait()
+            MenuItem.objects.filter(pk=item.pk).update(name='New name')
+            later = threading.Thread(target=rebuild, name='later')
+            later.start()
+            earlier.join()
+            later.join()
+
+        self.assertEqual(events, [('start', 'earlier'), ('end', 'earlier'), ('start', 'later'), ('end', 'later')])
+        body = bytes(MenuSnapshot.objects.get(restaurant=restaurant).body)
+        self.assertIn(b'New name', body)
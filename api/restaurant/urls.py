@@ -1,13 +1,21 @@
 from django.urls import path, include
-from .views import  RestaurantInfoView, MenuView, MenuItemView, OrderView, OrderItemView, CartItemView
+from .views import  RestaurantInfoView, MenuView, MenuItemView, OrderView, OrderItemView, CartItemView, KitchenQueueView, OwnerDashboardView, TeardownJobView, MenuImportView, MenuExportView, MenuChangesView, MenuSnapshotView, MenuItemBatchView
 
 urlpatterns = [
     # path('', index, name='restaurant_index'),
     path('info/', RestaurantInfoView.as_view(), name='restaurant_info'),
+    path('teardown/', TeardownJobView.as_view(), name='restaurant_teardown_job'),
     path('menu/', MenuView.as_view(), name='restaurant_menu_detail'),
+    path('menu/import/', MenuImportView.as_view(), name='restaurant_menu_import'),
+    path('menu/export/', MenuExportView.as_view(), name='restaurant_menu_export'),
+    path('menu/changes/', MenuChangesView.as_view(), name='restaurant_menu_changes'),
+    path('menu/snapshot/', MenuSnapshotView.as_view(), name='restaurant_menu_snapshot'),
     path('menu/item/', MenuItemView.as_view(), name='restaurant_menu_item_detail'),
+    path('menu/item/batch/', MenuItemBatchView.as_view(), name='restaurant_menu_item_batch'),
     path('order/', OrderView.as_view(), name='restaurant_order_detail'),
     path('order/item/', OrderItemView.as_view(), name='restaurant_order_item_detail'),
+    path('kitchen/queue/', KitchenQueueView.as_view(), name='restaurant_kitchen_queue'),
+    path('dashboard/', OwnerDashboardView.as_view(), name='restaurant_owner_dashboard'),
     path('cart/', CartItemView.as_view(), name='restaurant_cart_item_detail'),
     
 ]
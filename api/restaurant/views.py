@@ -1,11 +1,31 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from .models import Restaurant, Menu, MenuItem, Order, OrderItem, CartItem
-from .serializers import RestaurantInfoSerializer, MenuSerializer, MenuItemSerializer, OrderSerializer, OrderItemSerializer, CartItemSerializer
+from .models import Restaurant, Menu, MenuItem, MenuSnapshot, Order, OrderItem, ArchivedOrder, CartItem, TeardownJob
+from .serializers import RestaurantInfoSerializer, MenuSerializer, MenuItemSerializer, MenuItemPatchSerializer, OrderSerializer, OrderItemSerializer, ArchivedOrderSerializer, ArchivedOrderItemSerializer, CartItemSerializer, TeardownJobSerializer, ValuesSerializer
+from .teardown import is_being_torn_down, start_teardown
+from .menu_io import FORMATS, MenuImportError, export_menu, guess_format, import_menu, iter_rows
+from .idempotency import idempotent
+from .kitchen import get_queue
+from .dashboard import owner_dashboard
+from .inventory import RESERVING_STATUSES, release_stock, reserve_stock
+from .menu_sync import CursorError, menu_changes
+from .signals import notify_menu_changed, notify_order_status_changed
+from .snapshots import accepted_encodings, build_snapshot
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from django.contrib.auth import get_user_model
+from django.conf import settings
+
+def being_deleted():
+    return Response({"error": "Restaurant is being deleted"}, status=status.HTTP_409_CONFLICT)
+
 
 class RestaurantInfoView(generics.GenericAPIView):
     serializer_class = RestaurantInfoSerializer
@@ -20,6 +40,27 @@ class RestaurantInfoView(generics.GenericAPIView):
                 location=OpenApiParameter.QUERY # Specify this is a query parameter
                                                 # Other options: PATH, HEADER, COOKIE
             ),
+            OpenApiParameter(
+                name='fields',
+                description='Comma-separated list of fields to return (default: all).',
+                required=False,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY
+            ),
+            OpenApiParameter(
+                name='store_ids',
+                description='Comma-separated store IDs: returns every matching restaurant keyed by store ID.',
+                required=False,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY
+            ),
+            OpenApiParameter(
+                name='include_status',
+                description='Add an is_open flag computed from the opening hours.',
+                required=False,
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY
+            ),
             # Add more OpenApiParameter instances here if you have other query params
         ],
         # You can add other extend_schema arguments like responses, summary etc.
@@ -30,16 +71,47 @@ class RestaurantInfoView(generics.GenericAPIView):
         """
         Retrieve restaurant information.
         If store_id is provided, it will return the restaurant information for that store.
+        If store_ids is provided, it will return the restaurants of all those stores
+        in one query, keyed by store id, plus the store ids that have none.
         """
         
         store_id = request.query_params.get('store_id')
-        if not store_id:
-            return Response({"error": "store_id is required", "params": "/?store_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
+        store_ids = request.query_params.get('store_ids')
+        if not store_id and not store_ids:
+            return Response({"error": "store_id or store_ids is required", "params": "/?store_id=<int> or /?store_ids=<int>,<int>,..."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = RestaurantInfoSerializer.requested_fields(request)
+        include_status = request.query_params.get('include_status', '').lower() in ('1', 'true', 'yes')
+        # is_open needs these columns even when they are not requested.
+        columns = fields + ['opening_time', 'closing_time', 'is_active'] if fields is not None and include_status else fields
+        restaurants = RestaurantInfoSerializer.prune(Restaurant.objects.all(), columns)
+
+        if store_ids:
+            try:
+                store_ids = list(dict.fromkeys(int(value) for value in store_ids.split(',') if value.strip()))
+            except ValueError:
+                return Response({"error": "store_ids must be a comma-separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+            if len(store_ids) > settings.RESTAURANT_BATCH_LIMIT:
+                return Response({"error": f"At most {settings.RESTAURANT_BATCH_LIMIT} store_ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+            found = {restaurant.store_id: restaurant for restaurant in restaurants.filter(store_id__in=store_ids)}
+            results = {}
+            # Keyed in the order the store ids were asked for.
+            for value in store_ids:
+                if value in found:
+                    results[value] = self.get_serializer(found[value], fields=fields).data
+                    if include_status:
+                        results[value]['is_open'] = found[value].is_open()
+            missing = [value for value in store_ids if value not in found]
+            return Response({"results": results, "missing": missing}, status=status.HTTP_200_OK)
 
         try:
-            restaurant = Restaurant.objects.get(store_id=store_id)
-            serializer = self.get_serializer(restaurant)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            restaurant = restaurants.get(store_id=store_id)
+            serializer = self.get_serializer(restaurant, fields=fields)
+            data = serializer.data
+            if include_status:
+                data['is_open'] = restaurant.is_open()
+            return Response(data, status=status.HTTP_200_OK)
         except Restaurant.DoesNotExist:
             return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -74,6 +146,8 @@ class RestaurantInfoView(generics.GenericAPIView):
 
         try:
             restaurant = Restaurant.objects.get(store_id=store_id)
+            if is_being_torn_down(restaurant.pk):
+                return being_deleted()
             serializer = self.get_serializer(restaurant, data=request.data.get('attributes', request.data), partial=True) #handles nested and non-nested data.
             if serializer.is_valid():
                 serializer.save()
@@ -86,18 +160,42 @@ class RestaurantInfoView(generics.GenericAPIView):
         """
         Delete an existing restaurant entry.
         The request should contain the store_id of the restaurant to be deleted.
+        The restaurant is deactivated right away and its menus, orders and carts
+        are deleted in the background; poll the returned job via /teardown/?job_id=<int>.
+        Pass include_store=true to delete the store as well.
         """
         store_id = request.query_params.get('store_id')
         if not store_id:
             return Response({"error": "store_id is required", "params": "/?store_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
         try:
             restaurant = Restaurant.objects.get(store_id=store_id)
-            restaurant.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
         except Restaurant.DoesNotExist:
             return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+
+        delete_store = request.query_params.get('include_store', '').lower() in ('1', 'true')
+        job = start_teardown(restaurant, delete_store=delete_store)
+        return Response(TeardownJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
         
 
+class TeardownJobView(APIView):
+    """
+    Reports the progress of a restaurant teardown started by RestaurantInfoView.delete.
+    """
+
+    def get(self, request, *args, **kwargs):
+        job_id = request.query_params.get('job_id')
+        if not job_id:
+            return Response({"error": "job_id is required", "params": "/?job_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = TeardownJob.objects.get(id=job_id)
+        except TeardownJob.DoesNotExist:
+            return Response({"error": "Teardown job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = TeardownJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class MenuView(APIView):
     """
     Handles CRUD operations for Restaurant Menus.
@@ -118,8 +216,9 @@ class MenuView(APIView):
         if not restaurant:
             return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
 
-        menus = restaurant.menus.all()
-        serializer = MenuSerializer(menus, many=True)
+        fields = MenuSerializer.requested_fields(request)
+        menus = MenuSerializer.prune(restaurant.menus.all(), fields)
+        serializer = MenuSerializer(menus, many=True, fields=fields)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
@@ -130,6 +229,8 @@ class MenuView(APIView):
         restaurant = self.get_restaurant(store_id)
         if not restaurant:
             return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+        if is_being_torn_down(restaurant.pk):
+            return being_deleted()
 
         serializer = MenuSerializer(data=request.data.get('attributes', request.data))
         if serializer.is_valid():
@@ -180,6 +281,154 @@ class MenuView(APIView):
     
     
     
+class MenuImportView(APIView):
+    """
+    Bulk-imports a restaurant's menu from an uploaded CSV / JSON / JSON Lines file.
+    Existing categories and items are matched by name and updated in place.
+    """
+
+    def post(self, request, *args, **kwargs):
+        store_id = request.data.get('store_id')
+        upload = request.FILES.get('file')
+        if not store_id or not upload:
+            return Response({"error": "store_id and file are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            restaurant = Restaurant.objects.get(store_id=store_id)
+        except Restaurant.DoesNotExist:
+            return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+        if is_being_torn_down(restaurant.pk):
+            return being_deleted()
+
+        fmt = request.data.get('file_format') or guess_format(upload.name)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        try:
+            report = import_menu(restaurant, iter_rows(upload, fmt), dry_run=dry_run)
+        except (MenuImportError, ValueError) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['errors']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class MenuExportView(APIView):
+    """
+    Streams a restaurant's menu in the same format the import accepts.
+    """
+
+    def get(self, request, *args, **kwargs):
+        store_id = request.query_params.get('store_id')
+        # Not "format": DRF reserves that query parameter for picking a renderer.
+        fmt = request.query_params.get('file_format', 'csv')
+        if not store_id:
+            return Response({"error": "store_id is required", "params": "/?store_id=<int>&file_format=csv|json|jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+        if fmt not in FORMATS:
+            return Response({"error": f"file_format must be one of: {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            restaurant = Restaurant.objects.get(store_id=store_id)
+        except Restaurant.DoesNotExist:
+            return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+
+        content_types = {'csv': 'text/csv', 'json': 'application/json', 'jsonl': 'application/x-ndjson'}
+        response = StreamingHttpResponse(export_menu(restaurant, fmt), content_type=content_types[fmt])
+        response['Content-Disposition'] = f'attachment; filename="menu-{store_id}.{fmt}"'
+        return response
+
+
+class MenuChangesView(APIView):
+    """
+    Delta sync for offline menus: menus and menu items changed after `since`
+    (ISO 8601) or after the position in `cursor`, and the ids deleted since.
+    Keep calling with the returned cursor while has_more is true. When
+    full_sync is true the client must replace its copy with the returned rows.
+    """
+
+    def get(self, request, *args, **kwargs):
+        store_id = request.query_params.get('store_id')
+        if not store_id:
+            return Response({"error": "store_id is required", "params": "/?store_id=<int>&since=<datetime>|cursor=<str>&limit=<int>"}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response({"error": "since must be an ISO 8601 datetime"}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        limit = request.query_params.get('limit')
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            limit = 0
+        if limit is not None and limit < 1:
+            return Response({"error": "limit must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            restaurant = Restaurant.objects.get(store_id=store_id)
+        except Restaurant.DoesNotExist:
+            return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            changes = menu_changes(restaurant, since=since, cursor=request.query_params.get('cursor'), limit=limit)
+        except CursorError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes, status=status.HTTP_200_OK)
+
+
+class MenuSnapshotView(APIView):
+    """
+    Serves a restaurant's whole menu (menus with their items) from the
+    prebuilt snapshot bytes, compressed with brotli or gzip when accepted.
+    """
+    # Column holding the body for each content coding, best first.
+    ENCODED_BODIES = (('br', 'body_br'), ('gzip', 'body_gzip'), (None, 'body'))
+
+    def get(self, request, *args, **kwargs):
+        store_id = request.query_params.get('store_id')
+        if not store_id:
+            return Response({"error": "store_id is required", "params": "/?store_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshots = MenuSnapshot.objects.filter(restaurant__store_id=store_id)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etag = snapshots.values_list('etag', flat=True).first()
+            if etag and f'"{etag}"' in [tag.strip() for tag in if_none_match.split(',')]:
+                response = HttpResponseNotModified()
+                response['ETag'] = f'"{etag}"'
+                return response
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        candidates = [(encoding, column) for encoding, column in self.ENCODED_BODIES if encoding is None or encoding in accepted]
+        row = None
+        for encoding, column in candidates:
+            row = snapshots.values_list('etag', column).first()
+            if row is None or row[1] is not None:
+                break
+
+        if row is None:
+            try:
+                restaurant = Restaurant.objects.get(store_id=store_id)
+            except Restaurant.DoesNotExist:
+                return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+            # First read of this menu: build it now, later changes rebuild it in the background.
+            snapshot = build_snapshot(restaurant.pk)
+            encoding, column = next((encoding, column) for encoding, column in candidates if getattr(snapshot, column) is not None)
+            row = (snapshot.etag, getattr(snapshot, column))
+
+        etag, body = row
+        response = HttpResponse(bytes(body), content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = f'"{etag}"'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
 class MenuItemView(APIView):
     """
     Handles CRUD operations for Menu Items.
@@ -202,9 +451,9 @@ class MenuItemView(APIView):
         if not menu:
             return Response({"error": "Menu not found for the given store_id and menu_id"}, status=status.HTTP_404_NOT_FOUND)
 
-        menu_items = menu.menu_items.all()
-        serializer = MenuItemSerializer(menu_items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        fields = MenuItemSerializer.requested_fields(request)
+        data = ValuesSerializer(MenuItemSerializer, fields=fields).serialize(menu.menu_items.all())
+        return Response(data, status=status.HTTP_200_OK)
     def post(self, request, *args, **kwargs):
         store_id = request.data.get('store_id')
         menu_id = request.data.get('menu_id')
@@ -216,6 +465,8 @@ class MenuItemView(APIView):
         menu = self.get_menu(store_id, menu_id)
         if not menu:
             return Response({"error": "Menu not found for the given store_id and menu_id"}, status=status.HTTP_404_NOT_FOUND)
+        if is_being_torn_down(menu.restaurant_id):
+            return being_deleted()
         
         serializer = MenuItemSerializer(data=request.data.get('attributes', request.data))
         if serializer.is_valid():
@@ -266,18 +517,69 @@ class MenuItemView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 
+class MenuItemBatchView(APIView):
+    """
+    Updates availability and/or price of many menu items of one store at once.
+    Body: {"store_id": <int>, "items": [{"item_id": <int>, "is_available": <bool>, "price": <decimal>}, ...]}
+    """
+
+    def patch(self, request, *args, **kwargs):
+        store_id = request.data.get('store_id')
+        patches = request.data.get('items')
+        if not store_id or not isinstance(patches, list) or not patches:
+            return Response({"error": "store_id and a non-empty items list are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(patches) > settings.MENU_ITEM_BATCH_LIMIT:
+            return Response({"error": f"At most {settings.MENU_ITEM_BATCH_LIMIT} items per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = MenuItemPatchSerializer(data=patches, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        patches = {patch['item_id']: patch for patch in serializer.validated_data}
+
+        # Ownership check and fetch in a single query.
+        items = list(
+            MenuItem.objects.select_related('menu')
+            .filter(menu__restaurant__store_id=store_id, id__in=patches.keys())
+        )
+        missing = patches.keys() - {item.id for item in items}
+        if missing:
+            return Response({"error": "MenuItem not found for the given store_id", "item_ids": sorted(missing)}, status=status.HTTP_404_NOT_FOUND)
+
+        now = timezone.now()
+        fields = {'updated_at'}
+        for item in items:
+            for field in ('is_available', 'price'):
+                if field in patches[item.id]:
+                    setattr(item, field, patches[item.id][field])
+                    fields.add(field)
+            item.updated_at = now
+
+        with transaction.atomic():
+            MenuItem.objects.bulk_update(items, sorted(fields))
+            notify_menu_changed(items[0].menu.restaurant_id, [item.id for item in items])
+
+        return Response({"updated": len(items), "items": MenuItemSerializer(items, many=True).data}, status=status.HTTP_200_OK)
+
+
 class OrderView(APIView):
     """
     Handles CRUD operations for Orders.
     """
 
 
-    def get_order(self, store_id ,order_id):
+    def get_order(self, store_id ,order_id, fields=None):
         try:
             restaurant = Restaurant.objects.get(store_id=store_id)
-            return restaurant.orders.get(id=order_id)
+            return OrderSerializer.prune(restaurant.orders.all(), fields).get(id=order_id)
         except (Restaurant.DoesNotExist, Order.DoesNotExist):
             return None
+
+    def get_archived_order(self, store_id, order_id, fields=None):
+        try:
+            restaurant = Restaurant.objects.get(store_id=store_id)
+            return ArchivedOrderSerializer.prune(restaurant.archived_orders.all(), fields).get(id=order_id)
+        except (Restaurant.DoesNotExist, ArchivedOrder.DoesNotExist):
+            return None
            
     def get(self, request, *args, **kwargs):
         store_id = request.query_params.get('store_id') or request.data.get('store_id')
@@ -285,12 +587,18 @@ class OrderView(APIView):
         if not order_id or not store_id:
             return Response({"error": "store_id and order_id is required", "params": "/?order_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = self.get_order(store_id, order_id)
+        fields = OrderSerializer.requested_fields(request)
+        order = self.get_order(store_id, order_id, fields)
         if not order:
+            # Finished orders may have been moved to the archive.
+            archived_order = self.get_archived_order(store_id, order_id, fields)
+            if archived_order:
+                return Response(ArchivedOrderSerializer(archived_order, fields=fields).data, status=status.HTTP_200_OK)
             return Response({"error": "Order not found for the given order_id"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = OrderSerializer(order)
+        serializer = OrderSerializer(order, fields=fields)
         return Response(serializer.data, status=status.HTTP_200_OK)
+    @idempotent('order-create')
     def post(self, request, *args, **kwargs):
         store_id = request.data.get('store_id')
         user_id = request.data.get('user_id')
@@ -302,6 +610,8 @@ class OrderView(APIView):
         restaurant = Restaurant.objects.filter(store_id=store_id).first()
         if not restaurant:
             return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+        if is_being_torn_down(restaurant.pk):
+            return being_deleted()
 
         # Get user
         User = get_user_model()
@@ -361,13 +671,41 @@ class OrderView(APIView):
         data = request.data.copy()
         data['user'] = user.id
         data['restaurant'] = restaurant.id
+        data = data.get('attributes', data)
 
-        serializer = OrderSerializer(order, data=data.get('attributes', data), partial=True)
-        if serializer.is_valid():
-            serializer.save(user=user, restaurant=restaurant)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        # Optimistic concurrency: the client may say which version it last saw.
+        expected_version = data.get('version')
+        if expected_version is not None and str(expected_version) != str(order.version):
+            return self.conflict(order)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(order, data=data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = {**serializer.validated_data, 'user': user, 'updated_at': timezone.now()}
+        changes.pop('restaurant', None)
+        old_status = order.order_status
+        if changes.get('order_status') == 'Processing' and old_status != 'Processing':
+            changes['processing_started_at'] = changes['updated_at']
+        # Single conditional UPDATE, no lock: loses cleanly to a concurrent change.
+        if not Order.objects.update_if_current(order, **changes):
+            current = restaurant.orders.filter(id=order_id).first()
+            if current is None:
+                return Response({"error": "Order not found for the given order_id and store_id"}, status=status.HTTP_404_NOT_FOUND)
+            return self.conflict(current)
+
+        for field, value in changes.items():
+            setattr(order, field, value)
+        order.version += 1
+        if order.order_status != old_status:
+            notify_order_status_changed(order, old_status)
+        return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
+
+    def conflict(self, order):
+        return Response(
+            {"error": "Order was changed by someone else; reload and retry", "current": OrderSerializer(order).data},
+            status=status.HTTP_409_CONFLICT
+        )
 
     def delete(self, request, *args, **kwargs):
         store_id = request.query_params.get('store_id') or request.data.get('store_id')
@@ -403,19 +741,28 @@ class OrderView(APIView):
                 {"error": "Order not found for the given order_id and store_id"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        lines = dict(order.items.values_list('item_id').annotate(quantity=Sum('quantity')).order_by())
         order.delete()
+        if order.order_status in RESERVING_STATUSES:
+            release_stock(order.restaurant_id, lines)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class OrderItemView(APIView):
     """
     Handles CRUD operations for Order Items.
     """
-    def get_order(self, store_id ,order_id):
+    def get_order(self, store_id ,order_id, fields=None):
         try:
             restaurant = Restaurant.objects.get(store_id=store_id)
-            return restaurant.orders.get(id=order_id)
+            return OrderSerializer.prune(restaurant.orders.all(), fields).get(id=order_id)
         except (Restaurant.DoesNotExist, Order.DoesNotExist):
             return None
+    def get_archived_order(self, store_id, order_id, fields=None):
+        try:
+            restaurant = Restaurant.objects.get(store_id=store_id)
+            return ArchivedOrderSerializer.prune(restaurant.archived_orders.all(), fields).get(id=order_id)
+        except (Restaurant.DoesNotExist, ArchivedOrder.DoesNotExist):
+            return None
     def get(self, request, *args, **kwargs):
         store_id = request.query_params.get('store_id') or request.data.get('store_id')
         order_id = request.query_params.get('order_id') or request.data.get('order_id')
@@ -424,12 +771,19 @@ class OrderItemView(APIView):
         if not order_id or not store_id:
             return Response({"error": "store_id and order_id is required", "params": "/?order_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
 
+        fields = OrderItemSerializer.requested_fields(request)
         order = self.get_order(store_id, order_id)
         if not order:
+            # Finished orders may have been moved to the archive.
+            archived_order = self.get_archived_order(store_id, order_id)
+            if archived_order:
+                archived_items = ArchivedOrderItemSerializer.prune(archived_order.items.all(), fields)
+                serializer = ArchivedOrderItemSerializer(archived_items, many=True, fields=fields)
+                return Response(serializer.data, status=status.HTTP_200_OK)
             return Response({"error": "Order not found for the given order_id"}, status=status.HTTP_404_NOT_FOUND)
 
-        order_items = order.items.all()
-        serializer = OrderItemSerializer(order_items, many=True)
+        order_items = OrderItemSerializer.prune(order.items.all(), fields)
+        serializer = OrderItemSerializer(order_items, many=True, fields=fields)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
@@ -445,19 +799,35 @@ class OrderItemView(APIView):
         order = self.get_order(store_id, order_id)
         if not order:
             return Response({"error": "Order not found for the given order_id"}, status=status.HTTP_404_NOT_FOUND)
+        if order.order_status not in RESERVING_STATUSES:
+            return Response({"error": f"Items cannot be added to a {order.order_status} order"}, status=status.HTTP_400_BAD_REQUEST)
+        if is_being_torn_down(order.restaurant_id):
+            return being_deleted()
 
         try:
-            menu_item = MenuItem.objects.get(id=item_id)
+            menu_item = MenuItem.objects.select_related('menu').get(id=item_id)
         except MenuItem.DoesNotExist:
             return Response({"error": "MenuItem not found"}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = OrderItemSerializer(data=request.data.get('attributes', request.data))
         if serializer.is_valid():
-            serializer.save(order=order, item=menu_item)
+            quantity = serializer.validated_data['quantity']
+            if not reserve_stock(menu_item, quantity):
+                return self.out_of_stock(menu_item)
+            try:
+                serializer.save(order=order, item=menu_item)
+            except Exception:
+                # Menu items and orders may be on different databases: undo by hand.
+                release_stock(order.restaurant_id, {menu_item.pk: quantity})
+                raise
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def out_of_stock(self, menu_item):
+        left = MenuItem.objects.filter(pk=menu_item.pk).values_list('stock', flat=True).first()
+        return Response({"error": "Not enough stock for this item", "item_id": menu_item.pk, "stock": left}, status=status.HTTP_409_CONFLICT)
+
 
     def put(self, request, *args, **kwargs):
         store_id = request.data.get('store_id')
@@ -478,6 +848,17 @@ class OrderItemView(APIView):
 
         serializer = OrderItemSerializer(order_item, data=request.data.get('attributes', request.data), partial=True)
         if serializer.is_valid():
+            if 'item' in serializer.validated_data and serializer.validated_data['item'].pk != order_item.item_id:
+                return Response({"error": "The menu item of an order line cannot be changed; remove it and add a new one"}, status=status.HTTP_400_BAD_REQUEST)
+            # Reserve or give back the difference in quantity.
+            extra = serializer.validated_data.get('quantity', order_item.quantity) - order_item.quantity
+            if order.order_status in RESERVING_STATUSES and extra:
+                if extra > 0:
+                    menu_item = MenuItem.objects.select_related('menu').get(pk=order_item.item_id)
+                    if not reserve_stock(menu_item, extra):
+                        return self.out_of_stock(menu_item)
+                else:
+                    release_stock(order.restaurant_id, {order_item.item_id: -extra})
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         
@@ -502,9 +883,76 @@ class OrderItemView(APIView):
             return Response({"error": "OrderItem not found with the given id"}, status=status.HTTP_404_NOT_FOUND)
 
         order_item.delete()
+        if order.order_status in RESERVING_STATUSES:
+            release_stock(order.restaurant_id, {order_item.item_id: order_item.quantity})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class KitchenQueueView(APIView):
+    """
+    The kitchen queue of a restaurant: its Pending and Processing orders in
+    the order they will be prepared, each with its position (1 = first) and
+    estimated ready time. With order_id, only that order.
+    """
+
+    def get(self, request, *args, **kwargs):
+        store_id = request.query_params.get('store_id')
+        order_id = request.query_params.get('order_id')
+        if not store_id:
+            return Response({"error": "store_id is required", "params": "/?store_id=<int>&order_id=<int>"}, status=status.HTTP_400_BAD_REQUEST)
+        if order_id is not None and not order_id.isdigit():
+            return Response({"error": "order_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        restaurant_id = Restaurant.objects.filter(store_id=store_id).values_list('id', flat=True).first()
+        if restaurant_id is None:
+            return Response({"error": "Restaurant not found for the given store_id"}, status=status.HTTP_404_NOT_FOUND)
+
+        queue = get_queue(restaurant_id)
+        if order_id is not None:
+            order_status = queue.status(int(order_id))
+            if order_status is None:
+                return Response({"error": "Order is not in the kitchen queue"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(order_status, status=status.HTTP_200_OK)
+
+        return Response({
+            "restaurant": restaurant_id,
+            "prep_seconds": round(queue.prep_seconds()),
+            "orders": queue.statuses(),
+        }, status=status.HTTP_200_OK)
+
+
+class OwnerDashboardView(APIView):
+    """
+    Today's figures for every store of the signed-in shop owner: restaurant
+    status, order counts by status and revenue, plus totals. Admins may pass
+    owner_id to see another owner's dashboard; date=YYYY-MM-DD picks another day.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        owner = request.user
+        owner_id = request.query_params.get('owner_id')
+        if owner_id and str(owner_id) != str(owner.pk):
+            if owner.role != 'admin':
+                return Response({"error": "Only admins can view another owner's dashboard"}, status=status.HTTP_403_FORBIDDEN)
+            owner = get_user_model().objects.filter(pk=owner_id).first()
+            if owner is None:
+                return Response({"error": "Invalid owner_id"}, status=status.HTTP_404_NOT_FOUND)
+        elif owner.role not in ('shop_owner', 'admin'):
+            return Response({"error": "Only shop owners have a dashboard"}, status=status.HTTP_403_FORBIDDEN)
+
+        day = request.query_params.get('date')
+        if day:
+            try:
+                day = parse_date(day)
+            except ValueError:
+                day = None
+            if day is None:
+                return Response({"error": "date must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(owner_dashboard(owner, day), status=status.HTTP_200_OK)
+
+
 class CartItemView(APIView):
     """
     Handles CRUD operations for Cart Items.
@@ -517,7 +965,7 @@ class CartItemView(APIView):
     def get_item(self, store_id, item_id):
         try:
             restaurant = Restaurant.objects.get(store_id=store_id)
-            return MenuItem.objects.get(menu__restaurant=restaurant, id=item_id)
+            return MenuItem.objects.select_related('menu').get(menu__restaurant=restaurant, id=item_id)
         except (Restaurant.DoesNotExist, MenuItem.DoesNotExist):
             return None
 
@@ -527,13 +975,14 @@ class CartItemView(APIView):
         if not user_id:
             return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart_items = self.get_cart(user_id)
-        if not cart_items:
+        fields = CartItemSerializer.requested_fields(request)
+        data = ValuesSerializer(CartItemSerializer, fields=fields).serialize(self.get_cart(user_id))
+        if not data:
             return Response({"error": "Cart not found for the given user_id"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = CartItemSerializer(cart_items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK)
     
+    @idempotent('cart-item-create')
     def post(self, request, *args, **kwargs):
         user_id = request.data.get('user_id')
         item_id = request.data.get('item_id')
@@ -553,6 +1002,8 @@ class CartItemView(APIView):
         menu_item = self.get_item(store_id, item_id)
         if not menu_item:
             return Response({"error": "MenuItem not found"}, status=status.HTTP_404_NOT_FOUND)
+        if is_being_torn_down(menu_item.menu.restaurant_id):
+            return being_deleted()
         
         request.data['item'] = item_id
         request.data['user'] = user_id
@@ -0,0 +1,159 @@
+"""
+Resized variants of uploaded and linked images.
+
+``build_variants(data, prefix)`` decodes an image once, applies its EXIF
+orientation and writes a WebP and a JPEG for every size in
+settings.IMAGE_VARIANT_SIZES (longest side in pixels, never enlarged).
+Variants are encoded from the pixels alone, so EXIF, GPS and other metadata
+are dropped. Files are named after a hash of their content, which makes the
+URLs safe to cache forever: a changed image gets new names, and a name that
+already exists is not written again.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import socket
+import ssl
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Pillow format name and save options per variant file extension.
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImageError(Exception):
+    pass
+
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 3
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS to an address resolved beforehand, with SNI and certificate checks
+    for the original host name.
+    """
+
+    def __init__(self, address, port, hostname, timeout):
+        super().__init__(address, port, timeout=timeout, context=ssl.create_default_context())
+        self.hostname = hostname
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.hostname)
+
+
+def _public_address(hostname, port):
+    """
+    Resolve hostname once and return an address to connect to, refusing
+    hosts with any non-public address.
+    """
+    try:
+        infos = socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+    except OSError as exc:
+        raise ImageError(f"Cannot resolve {hostname}: {exc}")
+    addresses = [info[4][0] for info in infos]
+    if not addresses or any(not ipaddress.ip_address(address.split('%')[0]).is_global for address in addresses):
+        raise ImageError(f"Refusing to fetch from a private address: {hostname}")
+    return addresses[0]
+
+
+def fetch_image(url):
+    """
+    Download an image over http(s), refusing private addresses and bodies
+    larger than settings.IMAGE_MAX_BYTES.
+
+    Every hop, redirects included, is resolved once, checked and then
+    connected to by that address, so neither a redirect nor a second DNS
+    answer can point the request at an internal host.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ImageError(f"Not an http(s) URL: {url}")
+        try:
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+        except ValueError:
+            raise ImageError(f"Invalid port in {url}")
+        address = _public_address(parts.hostname, port)
+
+        timeout = settings.IMAGE_FETCH_TIMEOUT
+        if parts.scheme == 'https':
+            connection = _PinnedHTTPSConnection(address, port, parts.hostname, timeout)
+        else:
+            connection = http.client.HTTPConnection(address, port, timeout=timeout)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        try:
+            connection.request('GET', path, headers={
+                'Host': parts.netloc.rpartition('@')[2],
+                'User-Agent': 'image-variants',
+            })
+            response = connection.getresponse()
+            if response.status in REDIRECT_STATUSES and response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            if response.status != 200:
+                raise ImageError(f"Cannot fetch {url}: HTTP {response.status}")
+            data = response.read(settings.IMAGE_MAX_BYTES + 1)
+        except (OSError, http.client.HTTPException) as exc:
+            raise ImageError(f"Cannot fetch {url}: {exc}")
+        finally:
+            connection.close()
+        if len(data) > settings.IMAGE_MAX_BYTES:
+            raise ImageError(f"Image larger than {settings.IMAGE_MAX_BYTES} bytes: {url}")
+        return data
+    raise ImageError(f"Too many redirects: {url}")
+
+
+def _encode(image, fmt):
+    pillow_format, options = FORMATS[fmt]
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and pillow_format == 'JPEG':
+        # JPEG has no transparency: flatten onto white.
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, 'white')
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    else:
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    output = io.BytesIO()
+    image.save(output, format=pillow_format, **options)
+    return output.getvalue()
+
+
+def _store(content, prefix, extension):
+    name = f'{prefix}/{hashlib.blake2b(content, digest_size=16).hexdigest()}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return default_storage.url(name)
+
+
+def build_variants(data, prefix):
+    """
+    Write the variants of the image in `data` under `prefix` in the default
+    storage. Returns {size name: {extension: url}}.
+    """
+    sizes = settings.IMAGE_VARIANT_SIZES
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # Lets the JPEG decoder scale down while decoding.
+            source.draft('RGB', (max(sizes.values()),) * 2)
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as exc:
+        raise ImageError(f"Cannot decode image: {exc}")
+
+    variants = {}
+    for size_name, size in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[size_name] = {fmt: _store(_encode(resized, fmt), prefix, fmt) for fmt in FORMATS}
+    return variants
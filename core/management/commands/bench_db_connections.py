@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.utils import ConnectionHandler
+
+
+class Command(BaseCommand):
+    help = (
+        "Time request-sized database work with a new connection per request "
+        "(CONN_MAX_AGE=0), with persistent connections (DB_CONN_MAX_AGE) and, "
+        "on PostgreSQL with psycopg 3, with the psycopg connection pool. Each "
+        "request runs the query between the same connection checks Django "
+        "makes at request start and finish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--query', default='SELECT 1', help="SQL run once per request.")
+
+    def handle(self, *args, **options):
+        if options['database'] not in settings.DATABASES:
+            raise CommandError(f"Unknown database '{options['database']}'.")
+        base = dict(settings.DATABASES[options['database']])
+        base['OPTIONS'] = {key: value for key, value in base.get('OPTIONS', {}).items() if key != 'pool'}
+
+        modes = {
+            'new connection': {**base, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+            'persistent': {**base, 'CONN_MAX_AGE': settings.DB_CONN_MAX_AGE or 60, 'CONN_HEALTH_CHECKS': True},
+        }
+        if base['ENGINE'] == 'django.db.backends.postgresql':
+            modes['pool'] = {
+                **base, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+                'OPTIONS': {**base['OPTIONS'], 'pool': {'min_size': 1, 'max_size': 2}},
+            }
+        else:
+            self.stdout.write(f"{base['ENGINE']}: no connection pool to compare.")
+
+        for mode, settings_dict in modes.items():
+            elapsed = self.run(settings_dict, options['requests'], options['query'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{mode}: {elapsed / options['requests'] * 1000:.3f} ms per request "
+                f"over {options['requests']} requests."
+            ))
+
+    def run(self, settings_dict, requests, query):
+        connections = ConnectionHandler({'default': settings_dict})
+        connection = connections['default']
+        try:
+            # One warm-up request, so every mode starts from the same state.
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+            connection.close_if_unusable_or_obsolete()
+
+            start = time.perf_counter()
+            for _ in range(requests):
+                connection.close_if_unusable_or_obsolete()  # request_started
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    cursor.fetchall()
+                connection.close_if_unusable_or_obsolete()  # request_finished
+            return time.perf_counter() - start
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
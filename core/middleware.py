@@ -0,0 +1,42 @@
+from django.conf import settings
+
+from .routers import use_replicas
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_PIN_COOKIE = 'db_primary_pin'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe requests to the API read from replicas; everything else reads
+    from the primary (see core.routers).
+
+    Unsafe requests stay on the primary, and a successful write sets a
+    short-lived cookie that keeps the client's follow-up reads on the primary
+    too (read-your-writes), covering the replication lag window.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        pinned = (
+            not safe
+            or not request.path.startswith(settings.REPLICA_ROUTED_PATHS)
+            or PRIMARY_PIN_COOKIE in request.COOKIES
+        )
+        with use_replicas(not pinned):
+            response = self.get_response(request)
+
+        if not safe and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,42 @@
+"""
+Paginators for very large tables.
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over big tables.
+
+    An unfiltered PostgreSQL queryset is counted from the planner's row
+    estimate (pg_class.reltuples) instead of a COUNT(*) that scans the table.
+    Small tables, filtered querysets and other databases get an exact count.
+    """
+    # Below this many (estimated) rows an exact count is cheap enough.
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= self.exact_count_threshold:
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct or query.combinator:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) for tables that have never been analyzed.
+        return row[0] if row and row[0] > 0 else None
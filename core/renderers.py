@@ -0,0 +1,63 @@
+"""
+orjson-backed JSON renderer and parser for the REST API.
+
+Output matches rest_framework's JSONRenderer byte for byte: every value orjson
+does not encode exactly the way DRF does (datetimes, Decimals, lazy strings,
+querysets...) is handed to DRF's own JSONEncoder.default. Pretty-printed
+responses (`; indent=N`, the browsable API) and installs without orjson use the
+stdlib implementation.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+if orjson is not None:
+    # Dict keys that are not strings (e.g. ids) become strings like json.dumps does.
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    _default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renderer which serializes to JSON with orjson.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # Same escaping of \u2028 and \u2029 as JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses JSON request bodies with orjson.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            # orjson never accepts NaN/Infinity, like the parser in strict mode.
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
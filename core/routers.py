@@ -0,0 +1,70 @@
+"""
+Database routers for the project.
+
+Writes always go to the primary ('default'). Reads go to the primary too,
+unless the code runs inside ``use_replicas()``: ReplicaRoutingMiddleware
+opts safe API requests in, and those reads are spread across the read
+replicas listed in settings.DATABASE_REPLICAS. Background tasks, management
+commands and the shell therefore read their own writes without having to
+ask. Inside a replica block, ``use_primary()`` pins a stretch of code back
+to the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DB = 'default'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def is_pinned_to_primary():
+    return not _replica_reads.get()
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    """
+    Let reads inside the block go to the read replicas (or, with
+    allowed=False, keep them on the primary).
+    """
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_primary():
+    """
+    Route every read inside the block to the primary database.
+    """
+    return use_replicas(False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads inside use_replicas() to a random replica, and every other
+    read and all writes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not _replica_reads.get():
+            return PRIMARY_DB
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in (PRIMARY_DB, *replicas):
+            # Related lookups stay on the database the instance came from.
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY_DB, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
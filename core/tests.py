@@ -0,0 +1,188 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from api.restaurant.models import Store
+from core.images import ImageError, fetch_image
+from core.middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware
+from core.routers import PrimaryReplicaRouter, use_primary, use_replicas
+
+SQLITE_TUNED = settings.SQLITE_TUNING and connection.vendor == 'sqlite'
+
+
+@skipUnless(SQLITE_TUNED, "SQLite tuning is off or the database is not SQLite")
+class SQLiteConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        self.owner = get_user_model().objects.create(username='owner')
+        Store.objects.create(owner=self.owner, name='first')
+
+    def test_connections_use_wal(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    def test_reader_does_not_block_writer(self):
+        snapshot_taken = threading.Event()
+        writer_done = threading.Event()
+        counts = []
+        errors = []
+
+        def reader():
+            # A read transaction holding its snapshot while the writer commits.
+            try:
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('BEGIN')
+                    cursor.execute('SELECT COUNT(*) FROM restaurant_store')
+                    counts.append(cursor.fetchone()[0])
+                    snapshot_taken.set()
+                    writer_done.wait(settings.SQLITE_BUSY_TIMEOUT)
+                    cursor.execute('SELECT COUNT(*) FROM restaurant_store')
+                    counts.append(cursor.fetchone()[0])
+                    cursor.execute('COMMIT')
+                    cursor.execute('SELECT COUNT(*) FROM restaurant_store')
+                    counts.append(cursor.fetchone()[0])
+            except Exception as exc:
+                errors.append(exc)
+                snapshot_taken.set()
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        self.assertTrue(snapshot_taken.wait(5))
+
+        start = time.monotonic()
+        with transaction.atomic():
+            Store.objects.create(owner=self.owner, name='second')
+        elapsed = time.monotonic() - start
+        writer_done.set()
+        thread.join(10)
+
+        self.assertEqual(errors, [])
+        self.assertLess(elapsed, 1, "the writer waited for the reader")
+        # The reader kept its snapshot until it ended its transaction.
+        self.assertEqual(counts, [1, 1, 2])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def read_db(self):
+        return PrimaryReplicaRouter().db_for_read(Store)
+
+    def test_reads_use_the_primary_by_default(self):
+        self.assertEqual(self.read_db(), 'default')
+        with use_replicas():
+            self.assertEqual(self.read_db(), 'replica_1')
+            with use_primary():
+                self.assertEqual(self.read_db(), 'default')
+            # Threads (the background pool) start outside the block.
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(self.read_db()))
+            thread.start()
+            thread.join()
+            self.assertEqual(seen, ['default'])
+        self.assertEqual(PrimaryReplicaRouter().db_for_write(Store), 'default')
+
+    def test_middleware_opts_safe_api_requests_in(self):
+        factory = RequestFactory()
+
+        def route(request):
+            middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse(self.read_db()))
+            return middleware(request).content.decode()
+
+        pinned = factory.get('/api/restaurant/menu/')
+        pinned.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        self.assertEqual(route(factory.get('/api/restaurant/menu/')), 'replica_1')
+        self.assertEqual(route(factory.post('/api/restaurant/menu/')), 'default')
+        self.assertEqual(route(factory.get('/admin/')), 'default')
+        self.assertEqual(route(pinned), 'default')
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    routes = {
+        '/image.png': (200, {}, b'\x89PNG image bytes'),
+        '/to-image': (302, {'Location': '/image.png'}, b''),
+        '/to-metadata': (302, {'Location': 'http://169.254.169.254/latest/meta-data/'}, b''),
+        '/to-intranet': (301, {'Location': 'http://intranet.example.com/secret'}, b''),
+        '/loop': (302, {'Location': '/loop'}, b''),
+    }
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers['Host']))
+        status, headers, body = self.routes.get(self.path, (404, {}, b''))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageFetchTests(SimpleTestCase):
+    """
+    fetch_image against a local server that images.example.com (a public
+    address) is routed to, while intranet.example.com resolves privately.
+    """
+    PUBLIC_ADDRESS = '93.184.216.34'
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), _ImageHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        getaddrinfo, create_connection = socket.getaddrinfo, socket.create_connection
+        names = {'images.example.com': self.PUBLIC_ADDRESS, 'intranet.example.com': '10.1.2.3'}
+
+        def fake_getaddrinfo(host, port, *args, **kwargs):
+            if host in names:
+                return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (names[host], port))]
+            return getaddrinfo(host, port, *args, **kwargs)
+
+        def fake_create_connection(address, *args, **kwargs):
+            if address[0] == self.PUBLIC_ADDRESS:
+                address = self.server.server_address
+            return create_connection(address, *args, **kwargs)
+
+        for target, fake in (('socket.getaddrinfo', fake_getaddrinfo), ('socket.create_connection', fake_create_connection)):
+            patcher = mock.patch(target, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_fetches_from_public_host(self):
+        self.assertEqual(fetch_image('http://images.example.com/image.png'), b'\x89PNG image bytes')
+        self.assertEqual(self.server.requests, [('/image.png', 'images.example.com')])
+
+    def test_follows_public_redirect(self):
+        self.assertEqual(fetch_image('http://images.example.com/to-image'), b'\x89PNG image bytes')
+        self.assertEqual([path for path, _ in self.server.requests], ['/to-image', '/image.png'])
+
+    def test_refuses_redirect_to_private_address(self):
+        for path in ('/to-metadata', '/to-intranet'):
+            with self.subTest(path), self.assertRaisesMessage(ImageError, 'private address'):
+                fetch_image(f'http://images.example.com{path}')
+
+    def test_refuses_private_host(self):
+        with self.assertRaisesMessage(ImageError, 'private address'):
+            fetch_image('http://intranet.example.com/image.png')
+        with self.assertRaisesMessage(ImageError, 'private address'):
+            fetch_image(f'http://127.0.0.1:{self.server.server_port}/image.png')
+        self.assertEqual(self.server.requests, [])
+
+    def test_gives_up_on_redirect_loops(self):
+        with self.assertRaisesMessage(ImageError, 'Too many redirects'):
+            fetch_image('http://images.example.com/loop')
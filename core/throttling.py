@@ -0,0 +1,128 @@
+"""
+Request throttling for the REST API.
+
+Every request is counted against a budget chosen by the URL name of the view
+and the caller's role (``User.role``, or ``anon``). Budgets are read from
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], most specific key first:
+
+    '<url_name>:<role>', '<url_name>', 'default:<role>', 'default'
+
+A rate of None means unlimited. Counts are kept per caller (user id, or client
+IP for anonymous requests) in the cache named by settings.THROTTLE_CACHE so
+that every worker shares them; while that cache is unreachable each process
+counts in local memory instead.
+
+The window is a sliding window counter: the count of the current fixed window
+plus the previous window's count weighted by how much of it still overlaps
+the sliding window. That is two cache round trips per request and no
+per-request storage.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# After the shared cache fails, stay on local memory this long before retrying it.
+SHARED_CACHE_RETRY_SECONDS = 5
+
+_local_cache = LocMemCache('throttle-fallback', {'OPTIONS': {'MAX_ENTRIES': 100000}})
+_shared_down_until = 0.0
+_parsed_rates = {}
+
+
+def parse_rate(rate):
+    """
+    '<requests>/<period>' as (requests, seconds), or None for unlimited.
+    """
+    if rate not in _parsed_rates:
+        _parsed_rates[rate] = SimpleRateThrottle.parse_rate(None, rate)
+    return _parsed_rates[rate]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttle with a separate budget per URL name and user role.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s:%(window)d'
+
+    def get_role(self, request):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return 'anon'
+        return getattr(user, 'role', None) or 'authenticated'
+
+    def get_rate(self, url_name, role):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        for scope in (f'{url_name}:{role}', url_name, f'default:{role}', 'default'):
+            if scope in rates:
+                return scope, rates[scope]
+        return None, None
+
+    def get_cache(self):
+        if time.monotonic() < _shared_down_until:
+            return _local_cache
+        return caches[settings.THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        role = self.get_role(request)
+        scope, rate = self.get_rate(url_name, role)
+        num_requests, duration = parse_rate(rate) or (None, None)
+        if num_requests is None:
+            return True
+
+        user = request.user
+        ident = user.pk if user and user.is_authenticated else self.get_ident(request)
+        # A scope shared by several URL names (e.g. 'default') is counted per URL name.
+        scope = f'{scope}@{url_name}' if scope.startswith('default') else scope
+
+        now = time.time()
+        window = int(now // duration)
+        elapsed = now - window * duration
+        key = self.cache_format % {'scope': scope, 'ident': ident, 'window': window}
+        previous_key = self.cache_format % {'scope': scope, 'ident': ident, 'window': window - 1}
+
+        try:
+            allowed = self.count(self.get_cache(), key, previous_key, num_requests, duration, elapsed)
+        except Exception:
+            global _shared_down_until
+            _shared_down_until = time.monotonic() + SHARED_CACHE_RETRY_SECONDS
+            logger.warning("Throttle cache unavailable, counting in local memory for %ss", SHARED_CACHE_RETRY_SECONDS)
+            allowed = self.count(_local_cache, key, previous_key, num_requests, duration, elapsed)
+        return allowed
+
+    def count(self, cache, key, previous_key, num_requests, duration, elapsed):
+        counts = cache.get_many([key, previous_key])
+        current, previous = counts.get(key, 0), counts.get(previous_key, 0)
+        overlap = 1 - elapsed / duration
+        if current + previous * overlap >= num_requests:
+            self.wait_seconds = self.time_until_allowed(current, previous, num_requests, duration, elapsed)
+            return False
+
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First request of the window. Keep it through the next window too.
+            if not cache.add(key, 1, timeout=2 * duration):
+                cache.incr(key)
+        return True
+
+    def time_until_allowed(self, current, previous, num_requests, duration, elapsed):
+        if current >= num_requests:
+            # Even with the previous window gone the budget is spent: wait for
+            # the next window, where this one's weight decays.
+            return duration - elapsed + duration * (1 - (num_requests - 1) / current)
+        # Wait until previous * overlap drops enough to fit one more request.
+        needed_overlap = (num_requests - 1 - current) / previous
+        return max(0.0, duration * (1 - needed_overlap) - elapsed)
+
+    def wait(self):
+        return self.wait_seconds